@@ -1,37 +1,45 @@
 import os
-import json
-import requests
+import time
 import pandas as pd
-import streamlit as st
+from progress import log, sink_executor
 from typing import List
-from apify_client import ApifyClient
+from concurrent.futures import as_completed
+from http_utils import http_get, http_post
+from metrics import timed_stage
+from markets import COUNTRY_CODES, PERIODS
 
 # 🔐 Apify credentials
 APIFY_API_KEY = os.getenv("APIFY_API_KEY")
-SCRAPER_ACTOR = "lexis-solutions/tiktok-trending-videos-scraper"
-ENRICHMENT_ACTOR = "clockworks~tiktok-video-scraper"  # HTTP API format uses ~
-
-client = ApifyClient(APIFY_API_KEY)
-
-
-def run_trending_scraper(country_code="United Kingdom", sort_by="hot", period_type="last 7 days", max_items=10) -> pd.DataFrame:
+SCRAPER_ACTOR = "lexis-solutions~tiktok-trending-videos-scraper"  # HTTP API format uses ~
+ENRICHMENT_ACTOR = "clockworks~tiktok-video-scraper"
+APIFY_API_URL = os.getenv("APIFY_API_URL", "https://api.apify.com")  # overridable for local stand-ins
+APIFY_API_BASE = f"{APIFY_API_URL}/v2"
+
+# ⏳ Actor run tracking
+SCRAPER_TIMEOUT = float(os.getenv("SCRAPER_TIMEOUT", "600"))  # seconds
+ENRICHMENT_TIMEOUT = float(os.getenv("ENRICHMENT_TIMEOUT", "600"))  # seconds
+MIN_POLL_WAIT = 2    # seconds, initial long-poll window
+MAX_POLL_WAIT = 60   # Apify caps waitForFinish at 60s
+DATASET_PAGE_SIZE = 1000
+TERMINAL_STATUSES = {"SUCCEEDED", "FAILED", "ABORTED", "TIMED-OUT"}
+
+# 🧩 Sharded enrichment for large URL lists
+ENRICHMENT_SHARD_SIZE = int(os.getenv("ENRICHMENT_SHARD_SIZE", "100"))
+ENRICHMENT_MAX_CONCURRENT_RUNS = int(os.getenv("ENRICHMENT_MAX_CONCURRENT_RUNS", "4"))
+ENRICHMENT_SHARD_RETRIES = 2
+
+
+@timed_stage()
+def run_trending_scraper(country_code="United Kingdom", sort_by="hot", period_type="last 7 days", max_items=10,
+                         timeout: float = SCRAPER_TIMEOUT) -> pd.DataFrame:
     """
     Triggers the Apify actor to fetch trending TikTok videos using user-defined parameters.
+    The run and its dataset go through http_utils like the enrichment calls, so they are counted
+    in the HTTP client metrics.
     """
     try:
-        country_map = {
-            "United Kingdom": "GB",
-            "United States": "US",
-            "France": "FR",
-            "Germany": "DE"
-        }
-        period_map = {
-            "last 7 days": "7",
-            "last 30 days": "30"
-        }
-
-        country_code_resolved = country_map.get(country_code, country_code)
-        period_resolved = period_map.get(period_type, period_type)
+        country_code_resolved = COUNTRY_CODES.get(country_code, country_code)
+        period_resolved = PERIODS.get(period_type, period_type)
 
         input_payload = {
             "countryCode": country_code_resolved,
@@ -41,122 +49,272 @@ def run_trending_scraper(country_code="United Kingdom", sort_by="hot", period_ty
             "resultsPerPage": max_items
         }
 
-        st.write("🎬 Starting Apify trending video scrape with parameters:")
-        st.json(input_payload)
+        log.write("🎬 Starting Apify trending video scrape with parameters:")
+        log.json(input_payload)
 
-        run = client.actor(SCRAPER_ACTOR).call(run_input=input_payload)
-        dataset_items = list(client.dataset(run["defaultDatasetId"]).iterate_items())
+        run = start_actor_run(SCRAPER_ACTOR, input_payload)
+        dataset_id = run["defaultDatasetId"]
+        dataset_items = [item for items in iter_run_items(run["id"], dataset_id, timeout=timeout) for item in items]
 
         if not dataset_items:
-            st.warning("⚠️ Apify returned an empty dataset.")
+            log.warning("⚠️ Apify returned an empty dataset.")
             return pd.DataFrame()
 
         df = pd.DataFrame(dataset_items)
-        st.write(f"🎥 Number of videos fetched: {len(df)}")
+        df.attrs["dataset_id"] = dataset_id
+        log.write(f"🎥 Number of videos fetched: {len(df)}")
         return df
 
     except Exception as e:
-        st.error("❌ Failed to run video scraper actor.")
-        st.error(str(e))
+        log.error("❌ Failed to run video scraper actor.")
+        log.error(str(e))
         return pd.DataFrame()
 
 
-def run_video_comment_scraper(video_urls: List[str]) -> pd.DataFrame:
+def load_trending_dataset(dataset_id: str) -> pd.DataFrame:
+    """Re-reads the items of an earlier trending scrape without starting a new actor run."""
+    try:
+        dataset_items = []
+        offset = 0
+        while True:
+            page = fetch_dataset_items(dataset_id, offset=offset)
+            offset += len(page)
+            dataset_items.extend(clean_items(page))
+            if len(page) < DATASET_PAGE_SIZE:
+                break
+        df = pd.DataFrame(dataset_items)
+        df.attrs["dataset_id"] = dataset_id
+        return df
+    except Exception as e:
+        log.warning(f"⚠️ Could not read Apify dataset {dataset_id}: {e}")
+        return pd.DataFrame()
+
+
+def _apify_headers() -> dict:
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {APIFY_API_KEY}"
+    }
+
+
+def start_actor_run(actor_id: str, run_input: dict) -> dict:
+    """Starts an actor run without waiting for it and returns the run object."""
+    response = http_post(
+        f"{APIFY_API_BASE}/acts/{actor_id}/runs",
+        json=run_input,
+        headers=_apify_headers(),
+        timeout=30
+    )
+    response.raise_for_status()
+    return response.json()["data"]
+
+
+def get_actor_run(run_id: str, wait_for_finish: int = 0) -> dict:
     """
-    Uses clockworks/tiktok-video-scraper via HTTP to enrich TikTok video URLs with sound metadata.
-    Waits dynamically until dataset is populated or timeout is reached.
+    Fetches the run object. With `wait_for_finish` > 0 Apify long-polls, returning as soon as
+    the run finishes or after that many seconds (max 60), whichever comes first.
     """
-    import requests
-    import json
-    import time
+    response = http_get(
+        f"{APIFY_API_BASE}/actor-runs/{run_id}",
+        params={"waitForFinish": int(wait_for_finish)},
+        headers=_apify_headers(),
+        timeout=wait_for_finish + 30
+    )
+    response.raise_for_status()
+    return response.json()["data"]
 
+
+def abort_actor_run(run_id: str) -> None:
+    http_post(f"{APIFY_API_BASE}/actor-runs/{run_id}/abort", headers=_apify_headers(), timeout=30)
+
+
+def fetch_dataset_items(dataset_id: str, offset: int = 0, limit: int = DATASET_PAGE_SIZE) -> list:
+    """
+    One page of raw dataset items. Not requested with `clean`: Apify would drop empty items from
+    the page while `offset` still counts them, so callers page by the raw length (see clean_items).
+    """
+    response = http_get(
+        f"{APIFY_API_BASE}/datasets/{dataset_id}/items",
+        params={"format": "json", "offset": offset, "limit": limit},
+        headers=_apify_headers(),
+        timeout=60
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def clean_items(items: list) -> list:
+    # Client-side equivalent of Apify's clean=1: hidden '#' fields and empty items are dropped
+    cleaned = ({key: value for key, value in item.items() if not key.startswith("#")} for item in items)
+    return [item for item in cleaned if item]
+
+
+def iter_run_items(run_id: str, dataset_id: str, timeout: float = ENRICHMENT_TIMEOUT):
+    """
+    Yields batches of new dataset items while the run is in progress, reading the dataset
+    incrementally by offset so no item is downloaded twice.
+
+    Completion is tracked through the run's status endpoint with long-polling; the poll window
+    grows while nothing new arrives and resets when items show up.
+    Raises TimeoutError (after aborting the run) if it has not finished within `timeout` seconds,
+    and RuntimeError if the run ends in any status other than SUCCEEDED.
+    """
+    deadline = time.monotonic() + timeout
+    offset = 0
+    wait = MIN_POLL_WAIT
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            abort_actor_run(run_id)
+            raise TimeoutError(f"Apify run {run_id} did not finish within {timeout:g}s")
+
+        run = get_actor_run(run_id, wait_for_finish=max(1, min(wait, remaining)))
+
+        received = 0
+        while True:
+            page = fetch_dataset_items(dataset_id, offset=offset)
+            if not page:
+                break
+            offset += len(page)
+            items = clean_items(page)
+            received += len(page)
+            if items:
+                yield items
+            if len(page) < DATASET_PAGE_SIZE:
+                break
+
+        status = run.get("status")
+        if status in TERMINAL_STATUSES:
+            if status != "SUCCEEDED":
+                raise RuntimeError(f"Apify run {run_id} finished with status {status}")
+            return
+
+        wait = MIN_POLL_WAIT if received else min(wait * 2, MAX_POLL_WAIT)
+
+
+def build_enrichment_input(post_urls: List[str]) -> dict:
+    return {
+        "postURLs": post_urls,
+        "mode": "bulk",
+        "shouldDownloadVideos": False,
+        "shouldDownloadCovers": False,
+        "scrapeRelatedVideos": False,
+        "shouldDownloadSubtitles": False,
+        "shouldDownloadSlideshowImages": False,
+        "resultsPerPage": len(post_urls)
+    }
+
+
+def valid_video_urls(video_urls: List[str]) -> List[str]:
+    # The clockworks actor needs full @username/video links
+    return [url for url in video_urls if url.startswith("https://www.tiktok.com/@")]
+
+
+@timed_stage()
+def run_enrichment_shard(urls: List[str], timeout: float = ENRICHMENT_TIMEOUT) -> list:
+    """Runs the clockworks actor for one shard of URLs and returns all its dataset items."""
+    run = start_actor_run(ENRICHMENT_ACTOR, build_enrichment_input(urls))
+    records = []
+    for items in iter_run_items(run["id"], run["defaultDatasetId"], timeout=timeout):
+        records.extend(items)
+    return records
+
+
+def run_sharded_enrichment(video_urls: List[str], shard_size: int = ENRICHMENT_SHARD_SIZE,
+                           max_concurrent_runs: int = ENRICHMENT_MAX_CONCURRENT_RUNS,
+                           retries: int = ENRICHMENT_SHARD_RETRIES,
+                           timeout: float = ENRICHMENT_TIMEOUT) -> pd.DataFrame:
+    """
+    Splits the URLs into shards of `shard_size`, runs up to `max_concurrent_runs` actor runs at once
+    and concatenates their datasets. Shards that fail or time out are retried on their own, up to
+    `retries` more times; URLs from shards that never succeed are reported and left out.
+    """
+    shards = [video_urls[i:i + shard_size] for i in range(0, len(video_urls), shard_size)]
+    log.write(f"🧩 Enriching {len(video_urls)} URLs in {len(shards)} shards ({max_concurrent_runs} concurrent runs)...")
+
+    results = {}
+    pending = list(range(len(shards)))
+    for attempt in range(retries + 1):
+        failed = []
+        with sink_executor(max_workers=max(1, max_concurrent_runs)) as executor:
+            futures = {executor.submit(run_enrichment_shard, shards[i], timeout): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                    log.write(f"✅ Shard {i + 1}/{len(shards)}: {len(results[i])} records")
+                except Exception as e:
+                    failed.append(i)
+                    log.warning(f"⚠️ Shard {i + 1}/{len(shards)} failed (attempt {attempt + 1}): {e}")
+
+        pending = sorted(failed)
+        if not pending:
+            break
+
+    if pending:
+        lost = sum(len(shards[i]) for i in pending)
+        log.error(f"❌ {len(pending)} shards ({lost} URLs) failed after {retries + 1} attempts.")
+
+    records = [record for i in sorted(results) for record in results[i]]
+    log.success(f"🎧 Enriched records received: {len(records)}")
+    return pd.DataFrame(records)
+
+
+@timed_stage()
+def run_video_comment_scraper(video_urls: List[str], timeout: float = ENRICHMENT_TIMEOUT,
+                              shard_size: int = ENRICHMENT_SHARD_SIZE,
+                              max_concurrent_runs: int = ENRICHMENT_MAX_CONCURRENT_RUNS) -> pd.DataFrame:
+    """
+    Uses clockworks/tiktok-video-scraper via HTTP to enrich TikTok video URLs with sound metadata.
+    Returns as soon as the actor run finishes (or after `timeout` seconds), reading the
+    dataset incrementally while the run is in progress.
+    Lists longer than `shard_size` are split across parallel actor runs (see run_sharded_enrichment).
+    """
     if not video_urls:
-        st.warning("⚠️ No video URLs provided to enrich.")
+        log.warning("⚠️ No video URLs provided to enrich.")
         return pd.DataFrame()
 
-    valid_urls = [url for url in video_urls if url.startswith("https://www.tiktok.com/@")]
+    valid_urls = valid_video_urls(video_urls)
     if not valid_urls:
-        st.error("❌ No valid TikTok @username/video links found. Aborting enrichment.")
+        log.error("❌ No valid TikTok @username/video links found. Aborting enrichment.")
         return pd.DataFrame()
 
+    if shard_size and len(valid_urls) > shard_size:
+        try:
+            return run_sharded_enrichment(valid_urls, shard_size=shard_size,
+                                          max_concurrent_runs=max_concurrent_runs, timeout=timeout)
+        except Exception as e:
+            log.error("❌ Failed to run sharded enrichment.")
+            log.error(str(e))
+            return pd.DataFrame()
+
+    records = []
     try:
-        st.write("🎼 Starting Apify enrichment (clockworks actor)...")
-
-        post_urls = valid_urls  # Required key format
-
-        run_input = {
-            "postURLs": post_urls,
-            "mode": "bulk",
-            "shouldDownloadVideos": False,
-            "shouldDownloadCovers": False,
-            "scrapeRelatedVideos": False,
-            "shouldDownloadSubtitles": False,
-            "shouldDownloadSlideshowImages": False,
-            "resultsPerPage": len(post_urls)
-        }
+        log.write("🎼 Starting Apify enrichment (clockworks actor)...")
 
-        st.json(run_input)
-        st.code(json.dumps(run_input, indent=2))
-        st.write("Number of video URLs passed:", len(post_urls))
+        run_input = build_enrichment_input(valid_urls)
 
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {APIFY_API_KEY}"
-        }
+        log.json(run_input)
+        log.debug("Number of video URLs passed:", len(valid_urls))
 
-        # Run Apify actor (async wait for completion)
-        response = requests.post(
-            f"https://api.apify.com/v2/acts/{ENRICHMENT_ACTOR}/runs?wait=1",
-            json=run_input,
-            headers=headers
-        )
-        response.raise_for_status()
-        run_data = response.json()
-        dataset_id = run_data["data"]["defaultDatasetId"]
-        st.write(f"📁 Enrichment dataset ID: {dataset_id}")
-
-                # ⏳ Poll dataset until it's populated with valid music data or timeout hits
-        dataset_items_url = f"https://api.apify.com/v2/datasets/{dataset_id}/items?format=json"
-        timeout = 1000  # seconds (5 min max)
-        poll_interval = 10
-        elapsed = 0
-        first_poll_delay = 60
-
-        time.sleep(first_poll_delay)  # Give Apify time to populate dataset
-        st.write("🔄 Polling Apify for dataset readiness...")
-
-        while elapsed < timeout:
-            items_response = requests.get(dataset_items_url, headers=headers)
-            if items_response.status_code == 200:
-                records = items_response.json()
-                if any("musicMeta" in r and r["musicMeta"] for r in records):
-                    st.success(f"🎧 Enriched records received: {len(records)}")
-                    return pd.DataFrame(records)
-
-            time.sleep(poll_interval)
-            elapsed += poll_interval
-            st.write(f"⏳ Waited {elapsed}s... still waiting for dataset with valid music metadata...")
-
-
-        st.write("🔄 Polling Apify for dataset readiness...")
-
-        while elapsed < timeout:
-            items_response = requests.get(dataset_items_url, headers=headers)
-            if items_response.status_code == 200:
-                records = items_response.json()
-                if records:
-                    st.success(f"🎧 Enriched records received: {len(records)}")
-                    return pd.DataFrame(records)
-
-            time.sleep(poll_interval)
-            elapsed += poll_interval
-            st.write(f"⏳ Waited {elapsed}s... still waiting for dataset...")
-
-        st.warning("⚠️ Enrichment timed out after 5 minutes without receiving any data.")
-        return pd.DataFrame()
+        run = start_actor_run(ENRICHMENT_ACTOR, run_input)
+        dataset_id = run["defaultDatasetId"]
+        log.write(f"📁 Enrichment dataset ID: {dataset_id}")
 
-    except Exception as e:
-        st.error("❌ Failed to run enrichment actor.")
-        st.error(str(e))
-        return pd.DataFrame()
+        started = time.monotonic()
+        for items in iter_run_items(run["id"], dataset_id, timeout=timeout):
+            records.extend(items)
+            log.write(f"⏳ {len(records)} records received after {time.monotonic() - started:.0f}s...")
+
+        log.success(f"🎧 Enriched records received: {len(records)}")
+        return pd.DataFrame(records)
 
+    except TimeoutError as e:
+        log.warning(f"⚠️ Enrichment timed out: {e}. Returning {len(records)} records received so far.")
+        return pd.DataFrame(records)
+
+    except Exception as e:
+        log.error("❌ Failed to run enrichment actor.")
+        log.error(str(e))
+        return pd.DataFrame(records)
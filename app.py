@@ -1,8 +1,75 @@
-from flask import Flask, request, jsonify
-from spotify_scraper import get_spotify_label
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, request, jsonify, Response, stream_with_context, g
+from spotify_scraper import fetch_spotify_label
+from spotify_cache import get_label_cache, normalize_sound_key
+from singleflight import SingleFlight
+from metrics import registry
 
 app = Flask(__name__)
 
+BATCH_MAX_TRACKS = int(os.getenv("BATCH_MAX_TRACKS", "500"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "8"))
+
+# Upstream protection: at most UPSTREAM_CONCURRENCY Spotify lookups at once per process;
+# a lookup that can't get a slot within UPSTREAM_QUEUE_TIMEOUT seconds is rejected with 503.
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "16"))
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "5"))
+RETRY_AFTER_SECONDS = 5
+
+upstream_slots = threading.BoundedSemaphore(UPSTREAM_CONCURRENCY)
+inflight_lookups = SingleFlight()
+
+
+class ServiceOverloaded(Exception):
+    pass
+
+
+def lookup_label(song: str, artist: str) -> dict:
+    """
+    Cached, coalesced label lookup: cache hits return immediately, and simultaneous
+    requests for the same (song, artist) share a single upstream Spotify lookup.
+    """
+    cache = get_label_cache()
+    cached = cache.get(song, artist)
+    if cached is not None:
+        return cached
+
+    def fetch():
+        if not upstream_slots.acquire(timeout=UPSTREAM_QUEUE_TIMEOUT):
+            raise ServiceOverloaded("Too many concurrent Spotify lookups, try again shortly")
+        try:
+            # The cache was checked above; going through get_spotify_label would count a second miss
+            result, complete = fetch_spotify_label(song, artist)
+        finally:
+            upstream_slots.release()
+        if complete:
+            cache.set(song, artist, result)
+        return result
+
+    return inflight_lookups.do(normalize_sound_key(song, artist), fetch)
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # Streamed batch responses are timed up to the first byte
+    started = getattr(g, "request_started", None)
+    if started is not None and request.url_rule is not None:
+        route = request.url_rule.rule
+        registry.observe("http_server_request_duration_seconds", time.perf_counter() - started, route=route)
+        registry.inc("http_server_requests_total", route=route, status=str(response.status_code))
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics_route():
+    return Response(registry.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/spotify_label", methods=["GET"])
 def get_spotify_label_route():
     song = request.args.get("song")
@@ -12,7 +79,7 @@ def get_spotify_label_route():
         return jsonify({"error": "Missing 'song' or 'artist' query parameter"}), 400
 
     try:
-        result = get_spotify_label(song, artist)
+        result = lookup_label(song, artist)
 
         # Catch unexpected None or bad return
         if not isinstance(result, dict):
@@ -20,9 +87,54 @@ def get_spotify_label_route():
 
         return jsonify(result)
 
+    except ServiceOverloaded as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(RETRY_AFTER_SECONDS)}
+
     except Exception as e:
         print("Error during label scrape:", e)
         return jsonify({"error": str(e)}), 500
 
+@app.route("/spotify_labels", methods=["POST"])
+def get_spotify_labels_route():
+    """
+    Batch lookup. Body: {"tracks": [{"song": ..., "artist": ...}, ...]}
+    Resolves tracks concurrently and streams one NDJSON line per track as soon as it is ready,
+    in completion order; each line carries the track's "index" in the request. Entries without
+    'song' and 'artist' get an "error" line of their own.
+    """
+    payload = request.get_json(silent=True) or {}
+    tracks = payload.get("tracks")
+
+    if not isinstance(tracks, list) or not tracks:
+        return jsonify({"error": "Body must be JSON with a non-empty 'tracks' list"}), 400
+    if len(tracks) > BATCH_MAX_TRACKS:
+        return jsonify({"error": f"At most {BATCH_MAX_TRACKS} tracks per request"}), 400
+
+    def generate():
+        # An entry without 'song' and 'artist' fails on its own line instead of failing the batch
+        valid = []
+        for i, t in enumerate(tracks):
+            if isinstance(t, dict) and t.get("song") and t.get("artist"):
+                valid.append(i)
+            else:
+                yield json.dumps({"index": i, "error": "Track needs 'song' and 'artist'", "status": 400}) + "\n"
+
+        with ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+            futures = {executor.submit(lookup_label, tracks[i]["song"], tracks[i]["artist"]): i for i in valid}
+            for future in as_completed(futures):
+                i = futures[future]
+                line = {"index": i, "song": tracks[i]["song"], "artist": tracks[i]["artist"]}
+                try:
+                    line.update(future.result())
+                except ServiceOverloaded as e:
+                    line.update({"error": str(e), "status": 503})
+                except Exception as e:
+                    print("Error during label scrape:", e)
+                    line["error"] = str(e)
+                yield json.dumps(line) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# Local development only; production runs under gunicorn (see gunicorn.conf.py)
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    app.run(host="0.0.0.0", port=8080, threaded=True)
@@ -0,0 +1,277 @@
+# benchmarks/fake_services.py
+"""
+Local stand-ins for the Apify and Spotify HTTP APIs, so the pipeline can be measured without
+spending Apify credits or Spotify quota.
+
+Both fakes run a ThreadingHTTPServer on 127.0.0.1 and support per-request latency and
+random 429 injection (with a Retry-After header).
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+SIGNED_LABELS = ["Sony Music Entertainment", "Universal Music Group", "Atlantic Records", "Columbia"]
+UNSIGNED_LABELS = ["DistroKid", "Independent", "Bedroom Tapes", "self-released"]
+
+VIDEO_ID_BASE = 7300000000000000000
+
+
+# --- Synthetic payloads -------------------------------------------------------------------
+
+def make_trending_items(n: int, country: str = "GB") -> list:
+    """Records shaped like the lexis-solutions trending scraper output."""
+    return [
+        {
+            "item_url": f"https://www.tiktok.com/@creator{i % 997}/video/{VIDEO_ID_BASE + i}",
+            "title": f"trending caption {i}",
+            "id": str(VIDEO_ID_BASE + i),
+            "cover": f"https://p16.example/cover/{i}.jpeg",
+            "country_code": country,
+            "duration": 10 + i % 50,
+        }
+        for i in range(n)
+    ]
+
+
+def make_enriched_item(url: str, n_sounds: int = 500, original_share: float = 0.2) -> dict:
+    """A record shaped like the clockworks tiktok-video-scraper output for `url`."""
+    match = re.search(r"/video/(\d+)", url)
+    video_id = int(match.group(1)) if match else 0
+    i = video_id - VIDEO_ID_BASE
+    sound = i % n_sounds
+    rng = random.Random(video_id)
+    original = rng.random() < original_share
+
+    return {
+        "id": str(video_id),
+        "text": f"video text {i} #fyp",
+        "webVideoUrl": url,
+        "createTimeISO": "2024-06-01T12:00:00.000Z",
+        "diggCount": rng.randint(100, 5_000_000),
+        "shareCount": rng.randint(0, 200_000),
+        "playCount": rng.randint(1_000, 80_000_000),
+        "commentCount": rng.randint(0, 100_000),
+        "authorMeta": {"name": f"creator{i % 997}", "id": str(i % 997)},
+        "videoMeta": {"duration": 10 + i % 50, "height": 1024, "width": 576},
+        "musicMeta": {
+            "musicId": str(9000 + sound),
+            "musicName": f"original sound - creator{i % 997}" if original else f"Song {sound}",
+            "musicAuthor": f"creator{i % 997}" if original else f"Artist {sound}",
+            "musicOriginal": original,
+        },
+        "hashtags": [{"name": "fyp"}, {"name": f"tag{i % 13}"}],
+    }
+
+
+# --- Server plumbing ----------------------------------------------------------------------
+
+class FakeService:
+    """Base for a fake upstream: `handle(method, path, query, body)` returns (status, payload, headers)."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, retry_after: int = 1, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttled = 0
+        self.server = None
+
+    def handle(self, method, path, query, body):
+        raise NotImplementedError
+
+    def start(self) -> str:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _dispatch(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                parts = urlsplit(self.path)
+                query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+                with service.lock:
+                    service.requests += 1
+                    throttle = service.rng.random() < service.error_rate
+                    if throttle:
+                        service.throttled += 1
+
+                if service.latency:
+                    time.sleep(service.latency)
+
+                if throttle:
+                    status, payload, headers = 429, {"error": {"status": 429, "message": "rate limited"}}, {
+                        "Retry-After": str(service.retry_after)
+                    }
+                else:
+                    status, payload, headers = service.handle(method, parts.path, query, raw)
+
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.requests = 0
+            self.throttled = 0
+
+
+# --- Apify --------------------------------------------------------------------------------
+
+class FakeApify(FakeService):
+    """
+    Actor runs, run status (with waitForFinish long-polling) and paginated dataset items.
+    A run takes `run_duration` seconds and its items appear in the dataset progressively.
+    """
+
+    def __init__(self, run_duration: float = 0.5, n_sounds: int = 500, **kwargs):
+        super().__init__(**kwargs)
+        self.run_duration = run_duration
+        self.n_sounds = n_sounds
+        self.runs = {}
+        self.datasets = {}
+
+    def _create_run(self, actor, run_input):
+        if "postURLs" in run_input:
+            items = [make_enriched_item(url, n_sounds=self.n_sounds) for url in run_input["postURLs"]]
+        else:
+            items = make_trending_items(int(run_input.get("maxItems", 10)), run_input.get("countryCode", "GB"))
+
+        run_id, dataset_id = uuid.uuid4().hex[:17], uuid.uuid4().hex[:17]
+        run = {"id": run_id, "actId": actor, "defaultDatasetId": dataset_id, "started": time.monotonic(),
+               "startedAt": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())}
+        with self.lock:
+            self.runs[run_id] = run
+            self.datasets[dataset_id] = (run_id, items)
+        return run
+
+    def _progress(self, run):
+        return min(1.0, (time.monotonic() - run["started"]) / self.run_duration) if self.run_duration else 1.0
+
+    def _run_payload(self, run):
+        # Every field of a real run object, so clients that validate the whole payload accept it
+        done = self._progress(run) >= 1.0
+        return {
+            "id": run["id"],
+            "actId": run["actId"],
+            "userId": "benchmark",
+            "startedAt": run["startedAt"],
+            "finishedAt": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()) if done else None,
+            "status": "SUCCEEDED" if done else "RUNNING",
+            "meta": {"origin": "API"},
+            "stats": {"inputBodyLen": 0, "restartCount": 0, "resurrectCount": 0, "computeUnits": 0},
+            "options": {"build": "latest", "timeoutSecs": 3600, "memoryMbytes": 1024, "diskMbytes": 2048},
+            "buildId": "benchmark-build",
+            "defaultKeyValueStoreId": run["id"] + "-kvs",
+            "defaultDatasetId": run["defaultDatasetId"],
+            "defaultRequestQueueId": run["id"] + "-rq",
+        }
+
+    def handle(self, method, path, query, body):
+        # The API accepts both /v2/acts/... and /v2/actors/...
+        m = re.fullmatch(r"/v2/(?:acts|actors)/([^/]+)/runs", path)
+        if m and method == "POST":
+            run = self._create_run(m.group(1), json.loads(body or b"{}"))
+            return 201, {"data": self._run_payload(run)}, None
+
+        m = re.fullmatch(r"/v2/actor-runs/([^/]+)(/abort)?", path)
+        if m and m.group(1) in self.runs:
+            run = self.runs[m.group(1)]
+            if m.group(2):
+                return 200, {"data": dict(self._run_payload(run), status="ABORTED")}, None
+            deadline = time.monotonic() + min(float(query.get("waitForFinish", 0)), 60)
+            while self._progress(run) < 1.0 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            return 200, {"data": self._run_payload(run)}, None
+
+        m = re.fullmatch(r"/v2/datasets/([^/]+)/items", path)
+        if m and m.group(1) in self.datasets:
+            run_id, items = self.datasets[m.group(1)]
+            visible = items[:int(len(items) * self._progress(self.runs[run_id]))]
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", len(visible) or 1))
+            page = visible[offset:offset + limit]
+            return 200, page, {
+                "X-Apify-Pagination-Total": str(len(visible)),
+                "X-Apify-Pagination-Offset": str(offset),
+                "X-Apify-Pagination-Limit": str(limit),
+                "X-Apify-Pagination-Count": str(len(page)),
+                "X-Apify-Pagination-Desc": "false",
+            }
+
+        return 404, {"error": {"type": "record-not-found", "message": path}}, None
+
+
+# --- Spotify ------------------------------------------------------------------------------
+
+class FakeSpotify(FakeService):
+    """Client-credentials token, track search and single / multi-album lookups."""
+
+    def __init__(self, n_albums: int = 300, **kwargs):
+        super().__init__(**kwargs)
+        self.n_albums = n_albums
+
+    def _album(self, album_id):
+        n = int(album_id.replace("album", "") or 0)
+        labels = SIGNED_LABELS if n % 3 == 0 else UNSIGNED_LABELS
+        return {"id": album_id, "name": f"Album {n}", "label": labels[n % len(labels)]}
+
+    def handle(self, method, path, query, body):
+        if path == "/api/token" and method == "POST":
+            return 200, {"access_token": uuid.uuid4().hex, "token_type": "Bearer", "expires_in": 3600}, None
+
+        if path == "/v1/search":
+            q = query.get("q", "")
+            if "nomatch" in q.lower():
+                return 200, {"tracks": {"items": []}}, None
+            album_id = f"album{sum(q.encode()) % self.n_albums}"
+            track = {
+                "name": q.rsplit(" Artist", 1)[0],
+                "artists": [{"name": "Artist " + q.rsplit(" Artist ", 1)[-1]}],
+                "album": {"id": album_id, "name": self._album(album_id)["name"]},
+            }
+            return 200, {"tracks": {"items": [track]}}, None
+
+        if path == "/v1/albums":
+            ids = [i for i in query.get("ids", "").split(",") if i]
+            return 200, {"albums": [self._album(i) for i in ids]}, None
+
+        m = re.fullmatch(r"/v1/albums/([^/]+)", path)
+        if m:
+            return 200, self._album(m.group(1)), None
+
+        return 404, {"error": {"status": 404, "message": path}}, None
@@ -0,0 +1,191 @@
+# benchmarks/run_benchmarks.py
+"""
+Offline benchmark suite: runs the pipeline stages against the local Apify / Spotify stand-ins
+in fake_services.py and reports latency and throughput as JSON.
+
+    python benchmarks/run_benchmarks.py --sizes 100,1000,10000 --output bench.json
+
+Upstream behaviour is configurable (latency, 429 rate, actor run duration), so results from
+different commits are only comparable when run with the same flags.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_services import FakeApify, FakeSpotify, make_trending_items, make_enriched_item  # noqa: E402
+
+
+def _configure_environment(apify_url: str, spotify_url: str, workdir: str, spotify_rate_limit: float) -> None:
+    # Must run before the pipeline modules are imported: they read their settings at import time
+    os.environ.update({
+        "APIFY_API_URL": apify_url,
+        "APIFY_API_KEY": "benchmark",
+        "SPOTIFY_API_BASE": f"{spotify_url}/v1",
+        "SPOTIFY_ACCOUNTS_URL": spotify_url,
+        "SPOTIFY_CLIENT_ID": "benchmark",
+        "SPOTIFY_CLIENT_SECRET": "benchmark",
+        "SPOTIFY_RATE_LIMIT": str(spotify_rate_limit),
+        "SPOTIFY_CACHE_PATH": os.path.join(workdir, "spotify_labels.sqlite"),
+        "TRENDING_CACHE_DIR": os.path.join(workdir, "trending"),
+        "ENRICHMENT_STORE_PATH": os.path.join(workdir, "enriched_videos.sqlite"),
+    })
+
+
+def _measure(name: str, size: int, fn, repeat: int, services=(), setup=None, min_rows: int = 1) -> dict:
+    # A stage that swallows an upstream error returns an empty frame; don't time that as a success
+    durations = []
+    upstream = {"requests": 0, "throttled": 0}
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        for service in services:
+            service.reset_counters()
+
+        started = time.perf_counter()
+        result = fn(*args)
+        durations.append(time.perf_counter() - started)
+
+        rows = len(result) if result is not None else 0
+        if rows < min_rows:
+            raise RuntimeError(f"{name} returned {rows} rows for n={size} (expected at least {min_rows})")
+
+        for service in services:
+            upstream["requests"] += service.requests
+            upstream["throttled"] += service.throttled
+
+    median = statistics.median(durations)
+    result = {
+        "benchmark": name,
+        "size": size,
+        "repeat": repeat,
+        "median_s": round(median, 6),
+        "min_s": round(min(durations), 6),
+        "max_s": round(max(durations), 6),
+        "items_per_s": round(size / median, 2) if median else None,
+    }
+    if services:
+        result["upstream_requests_per_run"] = upstream["requests"] / repeat
+        result["upstream_429_per_run"] = upstream["throttled"] / repeat
+    print(f"{name:<32} n={size:<6} median={median:8.3f}s  {result['items_per_s']:>12} items/s", file=sys.stderr)
+    return result
+
+
+def run_suite(sizes, repeat: int, apify: FakeApify, spotify: FakeSpotify) -> list:
+    import pandas as pd
+    from apify_utils import run_trending_scraper, run_video_comment_scraper
+    from data_utils import process_raw_data, process_enriched_video_data, filter_music_only
+    from spotify_scraper import enrich_with_spotify
+    from spotify_cache import get_label_cache
+    from label_filter import filter_unsigned_tracks
+    from sound_ranking import aggregate_sounds, top_n_sounds
+
+    results = []
+    for size in sizes:
+        trending_items = make_trending_items(size)
+        urls = [item["item_url"] for item in trending_items]
+        enriched_items = [make_enriched_item(url, n_sounds=apify.n_sounds) for url in urls]
+
+        results.append(_measure(
+            "run_trending_scraper", size,
+            lambda: run_trending_scraper(max_items=size), repeat, services=[apify], min_rows=size))
+
+        results.append(_measure(
+            "run_video_comment_scraper", size,
+            lambda: run_video_comment_scraper(urls), repeat, services=[apify], min_rows=size))
+
+        raw_df = pd.DataFrame(trending_items)
+        results.append(_measure(
+            "process_raw_data", size,
+            process_raw_data, repeat, setup=lambda: (raw_df.copy(),), min_rows=size))
+
+        enriched_raw_df = pd.DataFrame(enriched_items)
+        results.append(_measure(
+            "process_enriched_video_data", size,
+            process_enriched_video_data, repeat, setup=lambda: (enriched_raw_df.copy(),), min_rows=size))
+
+        enriched_df = process_enriched_video_data(enriched_raw_df.copy())
+        results.append(_measure(
+            "filter_music_only", size,
+            filter_music_only, repeat, setup=lambda: (enriched_df,)))
+
+        spotify_input_df = filter_music_only(enriched_df).rename(columns={"Music": "Song Title", "Music author": "Artist"})
+
+        def cold_cache():
+            get_label_cache().clear()
+            return (spotify_input_df,)
+
+        results.append(_measure(
+            "enrich_with_spotify", len(spotify_input_df),
+            enrich_with_spotify, repeat, services=[spotify], setup=cold_cache, min_rows=len(spotify_input_df)))
+
+        get_label_cache().clear()
+        spotify_df = enrich_with_spotify(spotify_input_df)
+        results.append(_measure(
+            "filter_unsigned_tracks", len(spotify_df),
+            filter_unsigned_tracks, repeat, setup=lambda: (spotify_df,)))
+
+        # Back to the 'Music' / 'Music author' names the pipeline uses after Spotify enrichment
+        sounds_input_df = spotify_df.rename(columns={"Song Title": "Music", "Artist": "Music author"})
+        results.append(_measure(
+            "aggregate_sounds+top_n", len(spotify_df),
+            lambda df: top_n_sounds(aggregate_sounds(df)), repeat, setup=lambda: (sounds_input_df,)))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against local Apify/Spotify stand-ins.")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma-separated video counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every fake request")
+    parser.add_argument("--spotify-429-rate", type=float, default=0.01)
+    parser.add_argument("--apify-429-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--run-duration", type=float, default=0.5, help="seconds each fake actor run takes")
+    parser.add_argument("--n-sounds", type=int, default=500, help="distinct sounds in the fake dataset")
+    parser.add_argument("--spotify-rate-limit", type=float, default=1000, help="client-side Spotify req/s")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    apify = FakeApify(run_duration=args.run_duration, n_sounds=args.n_sounds, latency=args.latency,
+                      error_rate=args.apify_429_rate, retry_after=args.retry_after)
+    spotify = FakeSpotify(latency=args.latency, error_rate=args.spotify_429_rate, retry_after=args.retry_after)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        _configure_environment(apify.start(), spotify.start(), workdir, args.spotify_rate_limit)
+        try:
+            sizes = [int(s) for s in args.sizes.split(",") if s]
+            results = run_suite(sizes, args.repeat, apify, spotify)
+        finally:
+            apify.stop()
+            spotify.stop()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": vars(args),
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,71 @@
+import os
 import pandas as pd
-import streamlit as st
-import re
+from progress import log
+from metrics import timed_stage
+
+# Store compacted string columns as pyarrow-backed strings (needs pyarrow)
+COMPACT_ARROW_STRINGS = os.getenv("COMPACT_ARROW_STRINGS", "0") == "1"
+
+# Columns kept by compact_frame and how each is stored. Anything not listed – the raw
+# authorMeta / musicMeta / videoMeta dicts, hashtags and unused Apify fields – is dropped.
+#   "category": low-cardinality text, "count": non-negative integer narrowed to the smallest type,
+#   "string": free text, "flag": nullable boolean, "timestamp": kept as datetime64[ns, UTC]
+COMPACT_SCHEMA = {
+    # process_raw_data
+    "video_url": "string",
+    "caption": "string",
+    "video_id": "string",
+    "thumbnail_url": "string",
+    "region": "category",
+    "regions": "category",
+    "region_count": "count",
+    "duration_seconds": "count",
+    # process_enriched_video_data
+    "Author": "category",
+    "Text": "string",
+    "Diggs": "count",
+    "Shares": "count",
+    "Plays": "count",
+    "Comments": "count",
+    "Duration (seconds)": "count",
+    "Music": "string",
+    "Music author": "category",
+    "Music ID": "string",
+    "Music original?": "flag",
+    "Create Time": "string",
+    "Fetched At": "timestamp",
+    "Video URL": "string",
+    # enrich_with_spotify
+    "Spotify Track": "string",
+    "Spotify Artist": "category",
+    "Album": "string",
+    "Label": "category",
+    "Sound Video Count": "count",
+}
+
+
+def _normalize_text(series: pd.Series) -> pd.Series:
+    return (
+        series.astype("string").fillna("")
+        .str.casefold()
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+
+
+# Normalized (title, artist) key, matching spotify_cache.normalize_sound_key
+def sound_key(titles: pd.Series, artists: pd.Series) -> pd.Series:
+    return _normalize_text(titles) + "\x1f" + _normalize_text(artists)
+
 
 # From Lexis Solutions trending scraper
+@timed_stage()
 def process_raw_data(df: pd.DataFrame) -> pd.DataFrame:
-    st.write("Raw DataFrame columns:", list(df.columns))
+    log.debug("Raw DataFrame columns:", list(df.columns))
 
     required_cols = ["item_url", "title", "id", "cover", "country_code", "duration"]
     if not all(col in df.columns for col in required_cols):
-        st.error("❌ Required video columns not found in the dataset.")
+        log.error("❌ Required video columns not found in the dataset.")
         return pd.DataFrame()
 
     df = df[required_cols].copy()
@@ -27,60 +84,166 @@ def process_raw_data(df: pd.DataFrame) -> pd.DataFrame:
     return df.reset_index(drop=True)
 
 
+# Extract the numeric TikTok id from video URLs; URLs without /video/<id> become null
+def extract_video_id(urls: pd.Series) -> pd.Series:
+    return urls.astype("string").str.extract(r"/video/(\d+)", expand=False)
+
+
+# Nested fields flattened out of the Clockworks records: output column -> "parent.child"
+NESTED_FIELDS = {
+    "Author": "authorMeta.name",
+    "Duration (seconds)": "videoMeta.duration",
+    "Music": "musicMeta.musicName",
+    "Music author": "musicMeta.musicAuthor",
+    "Music ID": "musicMeta.musicId",
+    "Music original?": "musicMeta.musicOriginal",
+}
+
+
 # From Clockworks video metadata scraper
+@timed_stage()
 def process_enriched_video_data(df: pd.DataFrame) -> pd.DataFrame:
-    st.write("Enriched DataFrame columns:", list(df.columns))
+    log.debug("Enriched DataFrame columns:", list(df.columns))
 
     if "musicMeta" not in df.columns or "webVideoUrl" not in df.columns:
-        st.error("❌ Required fields 'musicMeta' or 'webVideoUrl' not found.")
+        log.error("❌ Required fields 'musicMeta' or 'webVideoUrl' not found.")
         return pd.DataFrame()
 
-    # Extract flattened columns
-    df["Author"] = df["authorMeta"].apply(lambda x: x.get("name") if isinstance(x, dict) else None)
-    df["Text"] = df["text"]
-    df["Diggs"] = df["diggCount"]
-    df["Shares"] = df["shareCount"]
-    df["Plays"] = df["playCount"]
-    df["Comments"] = df["commentCount"]
-    df["Duration (seconds)"] = df["videoMeta"].apply(lambda x: x.get("duration") if isinstance(x, dict) else None)
-    df["Music"] = df["musicMeta"].apply(lambda x: x.get("musicName") if isinstance(x, dict) else None)
-    df["Music author"] = df["musicMeta"].apply(lambda x: x.get("musicAuthor") if isinstance(x, dict) else None)
-    df["Music original?"] = df["musicMeta"].apply(lambda x: x.get("musicOriginal") if isinstance(x, dict) else None)
-    df["Create Time"] = df["createTimeISO"]
-    df["Video URL"] = df["webVideoUrl"]
+    df = df.reset_index(drop=True)
+
+    # Flatten the nested meta dicts straight from each parent column (non-dict values give None)
+    columns = {}
+    for name, path in NESTED_FIELDS.items():
+        parent, child = path.split(".", 1)
+        values = df[parent].tolist() if parent in df.columns else [None] * len(df)
+        columns[name] = pd.Series([v.get(child) if isinstance(v, dict) else None for v in values],
+                                  index=df.index, dtype=object)
+
+    def column(name):
+        return df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+
+    columns.update({
+        "Text": column("text"),
+        "Diggs": column("diggCount"),
+        "Shares": column("shareCount"),
+        "Plays": column("playCount"),
+        "Comments": column("commentCount"),
+        "Create Time": column("createTimeISO"),
+        "Fetched At": pd.to_datetime(pd.to_numeric(column("fetchedAt"), errors="coerce"), unit="s", utc=True),
+        "Video URL": df["webVideoUrl"],
+    })
 
     # Extract and normalize video_id
-    import re
-    df["video_id"] = df["Video URL"].apply(lambda url: re.search(r'/video/(\d+)', url).group(1) if isinstance(url, str) else None)
-    df["video_url"] = df["video_id"].apply(lambda vid: f"https://www.tiktok.com/video/{vid}")
-
-    return df.reset_index(drop=True)
+    video_id = extract_video_id(df["webVideoUrl"])
+    columns["video_id"] = video_id
+    columns["video_url"] = "https://www.tiktok.com/video/" + video_id
 
+    return df.assign(**columns)
 
 
 # Filter music only (exclude "original sound" etc.)
+@timed_stage()
 def filter_music_only(df: pd.DataFrame) -> pd.DataFrame:
-    st.write("🔍 Filtering non-music sounds...")
+    log.write("🔍 Filtering non-music sounds...")
     if "Music" not in df.columns:
-        st.warning("⚠️ 'Music' column missing — cannot filter music.")
+        log.warning("⚠️ 'Music' column missing — cannot filter music.")
         return df
 
     # Exclude original sounds and empty music titles
     music_df = df[~df["Music"].str.lower().str.contains("original sound", na=False)]
     music_df = music_df[df["Music"].str.strip() != ""]
 
-    st.write(f"🎼 Music-based videos remaining: {len(music_df)}")
+    log.write(f"🎼 Music-based videos remaining: {len(music_df)}")
     return music_df.reset_index(drop=True)
 
 
 
+INT64_MAX_DIGITS = str(2**63 - 1)
+
+
+# Digit strings to nullable int64 ids; anything else (or above the int64 range) becomes null
+def parse_video_id(ids: pd.Series) -> pd.Series:
+    ids = ids.astype("string").str.strip()
+    ids = ids.where(ids.str.fullmatch(r"\d{1,19}").fillna(False).astype(bool))
+    # 19 digits can still exceed int64; compare as zero-padded strings and null anything above the max
+    ids = ids.where((ids.str.zfill(19) <= INT64_MAX_DIGITS).fillna(False).astype(bool))
+
+    # Parse through Python ints rather than floats so 19-digit ids stay exact
+    parsed = pd.Series(pd.NA, index=ids.index, dtype="Int64")
+    valid = ids.notna().to_numpy()
+    parsed[valid] = ids[valid].to_numpy(dtype=object).astype("int64")
+    return parsed
+
+
+# Canonical int64 TikTok id (nullable): taken from the URL's /video/<id>, else the video_id column
+def canonical_video_id(df: pd.DataFrame) -> pd.Series:
+    ids = pd.Series(pd.NA, index=df.index, dtype="string")
+    if "video_url" in df.columns:
+        ids = extract_video_id(df["video_url"])
+    if "video_id" in df.columns:
+        ids = ids.fillna(df["video_id"].astype("string").str.strip())
+    return parse_video_id(ids)
+
+
 # Merge enriched metadata with raw video data
+@timed_stage()
 def merge_video_and_song_data(video_df: pd.DataFrame, enriched_df: pd.DataFrame) -> pd.DataFrame:
-    st.write("Merging video data with enriched sound metadata...")
-    if "video_url" not in video_df.columns or "video_url" not in enriched_df.columns:
-        st.error("❌ 'video_url' must be present in both DataFrames.")
-        return pd.DataFrame()
-
-    merged_df = pd.merge(video_df, enriched_df, on="video_url", how="inner")
-    st.write(f"✅ Merged {len(merged_df)} records.")
+    log.write("Merging video data with enriched sound metadata...")
+    for name, df in (("video", video_df), ("enriched", enriched_df)):
+        if "video_id" not in df.columns and "video_url" not in df.columns:
+            log.error(f"❌ 'video_id' or 'video_url' must be present in the {name} DataFrame.")
+            return pd.DataFrame()
+
+    video_keyed = video_df.assign(video_id=canonical_video_id(video_df))
+    enriched_keyed = enriched_df.assign(video_id=canonical_video_id(enriched_df))
+
+    video_ids = video_keyed["video_id"].dropna()
+    enriched_ids = enriched_keyed["video_id"].dropna()
+    unmatched_video = len(video_keyed) - int(video_ids.isin(enriched_ids).sum())
+    unmatched_enriched = len(enriched_keyed) - int(enriched_ids.isin(video_ids).sum())
+
+    # Indexed join on sorted int64 keys
+    left = video_keyed.dropna(subset=["video_id"]).astype({"video_id": "int64"}).set_index("video_id").sort_index()
+    right = enriched_keyed.dropna(subset=["video_id"]).astype({"video_id": "int64"}).set_index("video_id").sort_index()
+    merged_df = left.join(right, how="inner", rsuffix="_enriched").reset_index()
+
+    merged_df.attrs["unmatched"] = {"video": unmatched_video, "enriched": unmatched_enriched}
+    log.write(f"✅ Merged {len(merged_df)} records.")
+    if unmatched_video or unmatched_enriched:
+        log.warning(f"⚠️ Unmatched rows: {unmatched_video} trending videos, {unmatched_enriched} enriched records.")
     return merged_df
+
+
+def _narrow_count(series: pd.Series) -> pd.Series:
+    values = pd.to_numeric(series, errors="coerce")
+    if values.isna().any():
+        # Nullable integer types keep missing counts without falling back to float64
+        top = values.max()
+        if pd.isna(top):
+            return values.astype("UInt8")
+        for dtype, limit in (("UInt8", 2**8), ("UInt16", 2**16), ("UInt32", 2**32)):
+            if values.min() >= 0 and top < limit:
+                return values.round().astype(dtype)
+        return values.round().astype("Int64")
+    return pd.to_numeric(values, downcast="unsigned" if (values >= 0).all() else "integer")
+
+
+# Shrink a pipeline frame for long-lived storage (e.g. st.session_state)
+def compact_frame(df: pd.DataFrame, schema: dict = None, arrow_strings: bool = None) -> pd.DataFrame:
+    schema = COMPACT_SCHEMA if schema is None else schema
+    arrow_strings = COMPACT_ARROW_STRINGS if arrow_strings is None else arrow_strings
+
+    compact = df[[col for col in df.columns if col in schema]]
+    converted = {}
+    for col in compact.columns:
+        kind = schema[col]
+        if kind == "category":
+            converted[col] = compact[col].astype("category")
+        elif kind == "count":
+            converted[col] = _narrow_count(compact[col])
+        elif kind == "flag":
+            converted[col] = compact[col].astype("boolean")
+        elif kind == "string" and arrow_strings:
+            converted[col] = compact[col].astype("string[pyarrow]")
+
+    return compact.assign(**converted) if converted else compact
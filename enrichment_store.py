@@ -0,0 +1,164 @@
+# enrichment_store.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import pandas as pd
+from progress import log
+
+from apify_utils import run_video_comment_scraper
+from data_utils import extract_video_id
+from metrics import record_cache, timed_stage
+
+# 🗄️ Local store of Clockworks enrichment records, keyed by TikTok video_id
+ENRICHMENT_STORE_PATH = os.getenv("ENRICHMENT_STORE_PATH", os.path.join(".cache", "enriched_videos.sqlite"))
+ENRICHMENT_MAX_AGE = int(os.getenv("ENRICHMENT_MAX_AGE", str(24 * 3600)))  # seconds
+
+
+class EnrichmentStore:
+    """
+    SQLite table of raw enriched records (musicMeta, counts, ...) with their fetch time.
+    A record older than `max_age` is stale and gets re-scraped.
+    """
+
+    def __init__(self, path: str = ENRICHMENT_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                record TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get_fresh(self, video_ids: list, max_age: int = ENRICHMENT_MAX_AGE) -> dict:
+        """
+        Returns {video_id: record} for the ids stored within the last `max_age` seconds.
+        Each record carries its fetch time (epoch seconds) under 'fetchedAt'.
+        """
+        cutoff = time.time() - max_age
+        found = {}
+        ids = list(dict.fromkeys(video_ids))
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT video_id, record, fetched_at FROM videos WHERE fetched_at >= ? AND video_id IN ({placeholders})",
+                    [cutoff, *chunk],
+                ).fetchall()
+                found.update(
+                    (video_id, {**json.loads(record), "fetchedAt": fetched_at})
+                    for video_id, record, fetched_at in rows
+                )
+        return found
+
+    def put(self, records: dict, fetched_at: float = None) -> None:
+        """Upserts {video_id: record}, stamped with `fetched_at` (default: the current time)."""
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO videos (video_id, record, fetched_at) VALUES (?, ?, ?)",
+                [(video_id, json.dumps(record, default=_json_default), fetched_at)
+                 for video_id, record in records.items()],
+            )
+            self.conn.commit()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_enrichment_store() -> EnrichmentStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = EnrichmentStore()
+        return _store
+
+
+def _is_missing(value) -> bool:
+    # DataFrame rows pad absent keys with NaN; drop those so the stored JSON stays clean
+    return isinstance(value, float) and value != value
+
+
+def _json_default(value):
+    # numpy scalars coming out of DataFrame rows
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _record_video_ids(enriched_df: pd.DataFrame) -> pd.Series:
+    ids = pd.Series(pd.NA, index=enriched_df.index, dtype="string")
+    if "webVideoUrl" in enriched_df.columns:
+        ids = extract_video_id(enriched_df["webVideoUrl"])
+    if "id" in enriched_df.columns:
+        ids = ids.fillna(enriched_df["id"].astype("string"))
+    return ids
+
+
+def split_known_videos(video_df: pd.DataFrame, max_age: int = ENRICHMENT_MAX_AGE,
+                       store: EnrichmentStore = None):
+    """
+    Splits `video_df` (needs 'video_url') into stored records that are still fresh and the
+    URLs that must be sent to the Clockworks actor. Returns (records, urls_to_fetch).
+    """
+    store = store or get_enrichment_store()
+
+    video_ids = extract_video_id(video_df["video_url"])
+    if "video_id" in video_df.columns:
+        video_ids = video_ids.fillna(video_df["video_id"].astype("string"))
+
+    known = store.get_fresh(video_ids.dropna().tolist(), max_age=max_age)
+    to_fetch = video_df.loc[~video_ids.isin(list(known)), "video_url"].tolist()
+    log.write(f"🗄️ {len(known)} videos already enriched, {len(to_fetch)} to fetch.")
+    record_cache("enrichment_store", hits=len(known), misses=len(to_fetch))
+    return list(known.values()), to_fetch
+
+
+def store_records(fetched_df: pd.DataFrame, store: EnrichmentStore = None) -> list:
+    """Saves freshly scraped records and returns them as a list of dicts, stamped with 'fetchedAt'."""
+    if fetched_df.empty:
+        return []
+    store = store or get_enrichment_store()
+    fetched_at = time.time()
+
+    fetched_ids = _record_video_ids(fetched_df)
+    valid = fetched_ids.notna()
+    fetched = {
+        video_id: {k: v for k, v in record.items() if not _is_missing(v)}
+        for video_id, record in zip(fetched_ids[valid], fetched_df[valid].to_dict("records"))
+    }
+    store.put(fetched, fetched_at=fetched_at)
+    # Keep records whose id couldn't be determined, just don't store them
+    records = list(fetched.values()) + fetched_df[~valid].to_dict("records")
+    return [{**record, "fetchedAt": fetched_at} for record in records]
+
+
+@timed_stage()
+def enrich_videos_incremental(video_df: pd.DataFrame, max_age: int = ENRICHMENT_MAX_AGE,
+                              store: EnrichmentStore = None) -> pd.DataFrame:
+    """
+    Returns raw enriched records for every video in `video_df` (needs 'video_url').
+    Only videos that are new, or whose stored record is older than `max_age` seconds, are sent to
+    the Clockworks actor; the fresh results are saved and merged with the stored records.
+    """
+    records, to_fetch = split_known_videos(video_df, max_age=max_age, store=store)
+    if to_fetch:
+        records.extend(store_records(run_video_comment_scraper(to_fetch), store=store))
+    return pd.DataFrame(records)
@@ -0,0 +1,14 @@
+# Gunicorn settings for the Spotify label service (app.py)
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# Threaded workers: in-flight lookups are coalesced per process, so prefer
+# few processes with many threads over many single-threaded processes.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+
+# Batch responses are streamed and can take a while for large pages
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = 5
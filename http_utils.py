@@ -0,0 +1,50 @@
+# http_utils.py
+
+import os
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import record_http_response, record_http_error
+
+# 🔌 Pooled keep-alive sessions, one per upstream host
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """
+    Returns the shared session for the URL's host, creating it on first use.
+    Connections are kept alive and reused across requests and threads.
+    """
+    host = urlsplit(url).netloc or url
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.hooks["response"].append(record_http_response)
+            _sessions[host] = session
+        return session
+
+
+def http_get(url: str, **kwargs) -> requests.Response:
+    return _request("GET", url, **kwargs)
+
+
+def http_post(url: str, **kwargs) -> requests.Response:
+    return _request("POST", url, **kwargs)
+
+
+def _request(method: str, url: str, **kwargs) -> requests.Response:
+    try:
+        return get_session(url).request(method, url, **kwargs)
+    except requests.RequestException:
+        record_http_error(url)
+        raise
@@ -1,5 +1,11 @@
+import os
 import re
 
+import numpy as np
+import pandas as pd
+
+from metrics import timed_stage
+
 EXCLUDED_LABELS = [
     "Sony", "Universal", "Warner", "UMG", "T-Series", "Virgin", "Som Livre", "WM Brazil",
     "SM", "RCA", "BIGHIT", "Republic", "Epic", "Interscope", "under exclusive license",
@@ -15,14 +21,79 @@ EXCLUDED_LABELS = [
     "Robots & Humans", "TDE", "Columbia", "The System", "300 entertainment", "Cash Money"
 ]
 
-def is_signed_label(label: str) -> bool:
+# Optional extra label list: one name per line, '#' starts a comment
+EXCLUDED_LABELS_FILE = os.getenv("EXCLUDED_LABELS_FILE")
+
+
+def load_label_list(path: str) -> list:
+    labels = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            name = line.split("#", 1)[0].strip()
+            if name:
+                labels.append(name)
+    return labels
+
+
+def _trie_regex(node: dict) -> str:
+    # A trie node as a regex: one branch per next character, optional when a name ends here
+    branches = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    if len(branches) == 1 and "" not in node:
+        return branches[0]
+    group = "(?:" + "|".join(branches) + ")"
+    return group + "?" if "" in node else group
+
+
+def build_label_pattern(labels) -> re.Pattern:
+    """
+    Compiles the label list into one case-folded regex. Names only match as whole words, so
+    short entries like "SM" or "Epic" don't fire inside unrelated words.
+    The names are merged into a character trie, so each position is checked against the
+    prefixes that can still match instead of against every name in turn.
+    """
+    trie = {}
+    for name in {name.casefold().strip() for name in labels if name and name.strip()}:
+        node = trie
+        for char in name:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return re.compile(rf"(?<!\w)(?:{_trie_regex(trie)})(?!\w)")
+
+
+def _default_labels() -> list:
+    labels = list(EXCLUDED_LABELS)
+    if EXCLUDED_LABELS_FILE:
+        labels.extend(load_label_list(EXCLUDED_LABELS_FILE))
+    return labels
+
+
+SIGNED_LABEL_PATTERN = build_label_pattern(_default_labels())
+
+
+def is_signed_label(label: str, pattern: re.Pattern = None) -> bool:
     if not isinstance(label, str):
         return False
-    label = label.lower()
-    for name in EXCLUDED_LABELS:
-        if name.lower() in label:
-            return True
-    return False
-
-def filter_unsigned_tracks(df, label_column="Label"):
-    return df[~df[label_column].apply(is_signed_label)]
+    pattern = pattern or SIGNED_LABEL_PATTERN
+    return pattern.search(label.casefold()) is not None
+
+
+def signed_label_mask(labels, pattern: re.Pattern = None) -> pd.Series:
+    """
+    Vectorized `is_signed_label` over a Series of labels (non-strings count as unsigned).
+    Each distinct label is matched once and the result mapped back to the rows.
+    """
+    pattern = pattern or SIGNED_LABEL_PATTERN
+    codes, uniques = pd.factorize(labels)
+    signed = pd.Series(uniques, dtype=object).str.casefold().str.contains(pattern, na=False).to_numpy(dtype=bool)
+    mask = np.zeros(len(codes), dtype=bool)
+    valid = codes >= 0
+    mask[valid] = signed[codes[valid]]
+    return pd.Series(mask, index=labels.index)
+
+
+@timed_stage()
+def filter_unsigned_tracks(df, label_column="Label", labels_file: str = None):
+    pattern = build_label_pattern(EXCLUDED_LABELS + load_label_list(labels_file)) if labels_file else None
+    return df[~signed_label_mask(df[label_column], pattern)]
@@ -0,0 +1,32 @@
+# markets.py
+
+# Kept free of heavy imports so the UI can build its widgets without loading the scraper clients
+
+# Display name → TikTok country code accepted by the trending scraper
+COUNTRY_CODES = {
+    "United Kingdom": "GB",
+    "United States": "US",
+    "France": "FR",
+    "Germany": "DE",
+    "Italy": "IT",
+    "Spain": "ES",
+    "Netherlands": "NL",
+    "Sweden": "SE",
+    "Poland": "PL",
+    "Ireland": "IE",
+    "Canada": "CA",
+    "Mexico": "MX",
+    "Brazil": "BR",
+    "Argentina": "AR",
+    "Australia": "AU",
+    "Japan": "JP",
+    "South Korea": "KR",
+    "Indonesia": "ID",
+    "Philippines": "PH",
+    "Nigeria": "NG",
+}
+
+PERIODS = {
+    "last 7 days": "7",
+    "last 30 days": "30"
+}
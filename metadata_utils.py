@@ -1,35 +1,70 @@
-import requests
-import streamlit as st
+import json
+from http_utils import http_get, http_post
 
 
 SPOTIFY_API_URL = "https://spotify-label-api.fly.dev/spotify_label"
+SPOTIFY_BATCH_API_URL = "https://spotify-label-api.fly.dev/spotify_labels"
+BATCH_PAGE_SIZE = 100
 
 
+def _to_metadata(data: dict) -> dict:
+    return {
+        "Spotify Title": data.get("Spotify Track"),
+        "Spotify Artist": data.get("Spotify Artist"),
+        "Album": data.get("Album"),
+        "Spotify Label": data.get("Label"),
+    }
+
+
+def _fallback_metadata(title: str, artist: str) -> dict:
+    return {
+        "Spotify Title": title,
+        "Spotify Artist": artist,
+        "Album": None,
+        "Spotify Label": None,
+    }
+
 
 def enrich_with_spotify_metadata(title: str, artist: str) -> dict:
     """Query your deployed Spotify label scraper."""
-    # Get secrets from environment variables (injected by Streamlit)
-    SPOTIFY_CLIENT_ID = st.secrets["SPOTIFY_CLIENT_ID"]
-    SPOTIFY_CLIENT_SECRET = st.secrets["SPOTIFY_CLIENT_SECRET"]
-    
     params = {"song": title, "artist": artist}
 
     try:
-        res = requests.get(SPOTIFY_API_URL, params=params, timeout=15)
+        res = http_get(SPOTIFY_API_URL, params=params, timeout=15)
         res.raise_for_status()
-        data = res.json()
-
-        return {
-            "Spotify Title": data.get("track"),
-            "Spotify Artist": data.get("artist"),
-            "Album": data.get("album"),
-            "Spotify Label": data.get("label"),
-        }
+        return _to_metadata(res.json())
     except Exception as e:
         print("Spotify label lookup failed:", e)
-        return {
-            "Spotify Title": title,
-            "Spotify Artist": artist,
-            "Album": None,
-            "Spotify Label": None,
-        }
+        return _fallback_metadata(title, artist)
+
+
+def enrich_many_with_spotify_metadata(pairs: list, page_size: int = BATCH_PAGE_SIZE) -> list:
+    """
+    Batch version of enrich_with_spotify_metadata: sends (title, artist) pairs to the
+    label service one page per request and reads the streamed NDJSON results.
+    Returns one metadata dict per pair, in input order. Pairs with a missing title or artist
+    are not sent and keep the fallback metadata.
+    """
+    results = [_fallback_metadata(title, artist) for title, artist in pairs]
+    valid = [i for i, (title, artist) in enumerate(pairs)
+             if isinstance(title, str) and title.strip() and isinstance(artist, str) and artist.strip()]
+
+    for start in range(0, len(valid), page_size):
+        page = valid[start:start + page_size]
+        body = {"tracks": [{"song": pairs[i][0], "artist": pairs[i][1]} for i in page]}
+
+        try:
+            with http_post(SPOTIFY_BATCH_API_URL, json=body, stream=True, timeout=(10, 120)) as res:
+                res.raise_for_status()
+                for line in res.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if "error" in data:
+                        print("Spotify label lookup failed:", data["error"])
+                        continue
+                    results[page[data["index"]]] = _to_metadata(data)
+        except Exception as e:
+            print("Spotify batch label lookup failed:", e)
+
+    return results
@@ -0,0 +1,172 @@
+# metrics.py
+
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# 📈 In-process metrics: stage timings, outbound HTTP calls and cache hit rates.
+# Rendered in Prometheus text format by the Flask service (/metrics) and as a table in the
+# Streamlit diagnostics panel.
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+HELP = {
+    "pipeline_stage_duration_seconds": "Wall time of pipeline stages",
+    "pipeline_stage_errors_total": "Pipeline stages that raised",
+    "http_client_request_duration_seconds": "Outbound HTTP request latency (time to response headers)",
+    "http_client_requests_total": "Outbound HTTP requests by host and status",
+    "http_server_request_duration_seconds": "Label service request latency",
+    "http_server_requests_total": "Label service requests by route and status",
+    "cache_requests_total": "Cache lookups by cache and result",
+    "spotify_rate_limited_total": "Spotify 429 responses that were retried",
+}
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render_prometheus(self) -> str:
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+        lines = []
+        with self.lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{fmt_labels(labels)} {value:g}")
+
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} histogram")
+                for bound, count in zip(DURATION_BUCKETS, h.buckets):
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', f'{bound:g}')])} {count}")
+                lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {h.count}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {h.sum:.6f}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> list:
+        """Flat rows for display: one per counter / histogram series."""
+        rows = []
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                rows.append({"metric": name, "labels": dict(labels), "count": value})
+            for (name, labels), h in sorted(self.histograms.items()):
+                rows.append({
+                    "metric": name,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "total_s": round(h.sum, 3),
+                    "mean_s": round(h.sum / h.count, 4) if h.count else None,
+                })
+        return rows
+
+
+registry = Registry()
+
+
+@contextmanager
+def stage(name: str):
+    """Times a pipeline stage; failures are counted and re-raised."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc("pipeline_stage_errors_total", stage=name)
+        raise
+    finally:
+        registry.observe("pipeline_stage_duration_seconds", time.perf_counter() - started, stage=name)
+
+
+def timed_stage(name: str = None):
+    """Decorator form of `stage`, named after the function by default."""
+    def decorator(fn):
+        stage_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_http_response(response, *args, **kwargs):
+    """requests response hook: latency and status per upstream host."""
+    host = urlsplit(response.url).netloc
+    registry.observe("http_client_request_duration_seconds", response.elapsed.total_seconds(), host=host)
+    registry.inc("http_client_requests_total", host=host, status=str(response.status_code))
+
+
+def record_http_error(url: str) -> None:
+    registry.inc("http_client_requests_total", host=urlsplit(url).netloc, status="error")
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0) -> None:
+    if hits:
+        registry.inc("cache_requests_total", hits, cache=cache, result="hit")
+    if misses:
+        registry.inc("cache_requests_total", misses, cache=cache, result="miss")
+
+
+def cache_hit_rates() -> dict:
+    """{cache: hit ratio} over everything recorded so far."""
+    totals = {}
+    with registry.lock:
+        for (name, labels), value in registry.counters.items():
+            if name != "cache_requests_total":
+                continue
+            labels = dict(labels)
+            hits, total = totals.get(labels["cache"], (0, 0))
+            totals[labels["cache"]] = (hits + (value if labels["result"] == "hit" else 0), total + value)
+    return {cache: hits / total for cache, (hits, total) in totals.items() if total}
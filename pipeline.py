@@ -0,0 +1,178 @@
+# pipeline.py
+"""
+Headless runner for the discovery pipeline:
+fetch trending → enrich sound metadata → music filter → Spotify labels → unsigned filter.
+
+    python pipeline.py --country "United States" --max-items 50 --output-dir output/2024-06-01
+
+Importable too: `run_pipeline(...)` returns every stage's frame.
+`--stream` (or `run_streaming_pipeline`) overlaps the stages and emits unsigned songs as found.
+"""
+
+import os
+import argparse
+import logging
+import pandas as pd
+
+from progress import LoggingSink, use_sink, log
+from trending import fetch_trending_videos, fetch_trending_fanout
+from enrichment_store import enrich_videos_incremental
+from data_utils import process_enriched_video_data, filter_music_only, compact_frame
+from spotify_scraper import enrich_with_spotify
+from label_filter import filter_unsigned_tracks
+from trend_history import append_snapshot, rank_with_history
+from sound_ranking import aggregate_sounds, top_n_sounds
+from streaming import stream_unsigned_tracks
+
+OUTPUT_FORMATS = ("parquet", "csv")
+
+
+def enrich_music_with_spotify(music_df: pd.DataFrame) -> pd.DataFrame:
+    """Runs Spotify enrichment on the music-only frame, keeping the 'Music' / 'Music author' names."""
+    spotify_input_df = music_df.rename(columns={"Music": "Song Title", "Music author": "Artist"})
+    spotify_df = enrich_with_spotify(spotify_input_df)
+    return spotify_df.rename(columns={"Song Title": "Music", "Artist": "Music author"})
+
+
+def _flat_columns(df: pd.DataFrame) -> pd.DataFrame:
+    # Raw nested payload columns (dicts / lists) don't belong in CSV or Parquet exports
+    nested = [
+        col for col in df.columns
+        if df[col].dtype == object and df[col].map(lambda v: isinstance(v, (dict, list))).any()
+    ]
+    return df.drop(columns=nested)
+
+
+def fetch_videos(country_code, sort_by, period_type, max_items, refresh=False) -> pd.DataFrame:
+    # A list of countries fans out into parallel scrapes (see trending.fetch_trending_fanout)
+    if isinstance(country_code, (list, tuple)):
+        return fetch_trending_fanout(country_code, [sort_by], [period_type], max_items, refresh=refresh)
+    return fetch_trending_videos(country_code, sort_by, period_type, max_items, refresh=refresh)
+
+
+def write_outputs(frames: dict, output_dir: str, formats=OUTPUT_FORMATS) -> dict:
+    """Writes each stage frame as <output_dir>/<stage>.<format>; returns {stage: [paths]}."""
+    os.makedirs(output_dir, exist_ok=True)
+    written = {}
+    for stage, df in frames.items():
+        flat_df = _flat_columns(df)
+        paths = []
+        for fmt in formats:
+            path = os.path.join(output_dir, f"{stage}.{fmt}")
+            if fmt == "parquet":
+                flat_df.to_parquet(path, index=False)
+            elif fmt == "csv":
+                flat_df.to_csv(path, index=False)
+            else:
+                raise ValueError(f"Unsupported output format: {fmt}")
+            paths.append(path)
+        written[stage] = paths
+    return written
+
+
+def run_pipeline(country_code="United Kingdom", sort_by="hot", period_type="last 7 days", max_items=10,
+                 refresh: bool = False, output_dir: str = None, formats=OUTPUT_FORMATS, sink=None) -> dict:
+    """
+    Runs every stage end to end and returns {stage: DataFrame} for
+    'videos', 'enriched', 'music', 'spotify', 'unsigned' and 'sounds' (top unsigned sounds). Stops early (with the
+    stages reached so far) when a stage comes back empty.
+    `country_code` may be a list of countries, scraped in parallel.
+    Progress goes to `sink` (default: Python logging); frames are written to `output_dir` if given.
+    """
+    with use_sink(sink or LoggingSink()):
+        frames = {}
+
+        frames["videos"] = fetch_videos(country_code, sort_by, period_type, max_items, refresh=refresh)
+        if frames["videos"].empty:
+            log.error("❌ No data returned from Apify.")
+            return frames
+
+        enriched_raw_df = enrich_videos_incremental(frames["videos"])
+        if enriched_raw_df.empty:
+            log.error("❌ Enrichment failed or returned no data.")
+            return frames
+
+        frames["enriched"] = compact_frame(process_enriched_video_data(enriched_raw_df))
+        append_snapshot(frames["enriched"])
+        frames["music"] = filter_music_only(frames["enriched"])
+        if frames["music"].empty:
+            log.warning("⚠️ No music-based videos to look up on Spotify.")
+        else:
+            frames["spotify"] = enrich_music_with_spotify(frames["music"])
+            frames["unsigned"] = rank_with_history(filter_unsigned_tracks(frames["spotify"]))
+            frames["sounds"] = top_n_sounds(aggregate_sounds(frames["unsigned"], video_df=frames["videos"]))
+            log.success(f"🆓 Found {len(frames['unsigned'])} unsigned or unknown-label songs.")
+
+        if output_dir:
+            written = write_outputs(frames, output_dir, formats=formats)
+            log.write(f"💾 Wrote {sum(len(p) for p in written.values())} files to {output_dir}")
+
+        return frames
+
+
+def run_streaming_pipeline(country_code="United Kingdom", sort_by="hot", period_type="last 7 days", max_items=10,
+                           refresh: bool = False, output_dir: str = None, formats=OUTPUT_FORMATS, sink=None,
+                           on_batch=None) -> dict:
+    """
+    Streaming variant of run_pipeline (see streaming.stream_unsigned_tracks): Spotify lookups and
+    label filtering start while enrichment is still running. `on_batch(df)` is called with each
+    batch of unsigned candidates as it is found. Returns {'videos', 'unsigned'}.
+    """
+    with use_sink(sink or LoggingSink()):
+        frames = {}
+
+        frames["videos"] = fetch_videos(country_code, sort_by, period_type, max_items, refresh=refresh)
+        if frames["videos"].empty:
+            log.error("❌ No data returned from Apify.")
+            return frames
+
+        batches = []
+        for batch in stream_unsigned_tracks(frames["videos"]):
+            batches.append(batch)
+            log.write(f"🆓 {len(batch)} more unsigned candidates ({sum(len(b) for b in batches)} so far)")
+            if on_batch is not None:
+                on_batch(batch)
+
+        frames["unsigned"] = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame()
+        log.success(f"🆓 Found {len(frames['unsigned'])} unsigned or unknown-label songs.")
+
+        if output_dir:
+            written = write_outputs(frames, output_dir, formats=formats)
+            log.write(f"💾 Wrote {sum(len(p) for p in written.values())} files to {output_dir}")
+
+        return frames
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the TikTok trending discovery pipeline without the UI.")
+    parser.add_argument("--country", dest="countries", action="append",
+                        help="repeatable; several countries are scraped in parallel (default: United Kingdom)")
+    parser.add_argument("--sort-by", default="hot", choices=["hot", "likes", "comments", "shares"])
+    parser.add_argument("--period", default="last 7 days")
+    parser.add_argument("--max-items", type=int, default=10)
+    parser.add_argument("--refresh", action="store_true", help="ignore cached trending results")
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--format", dest="formats", action="append", choices=OUTPUT_FORMATS,
+                        help="output format (repeatable; default: parquet and csv)")
+    parser.add_argument("--stream", action="store_true", help="overlap stages and emit unsigned songs as found")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, format="%(asctime)s %(message)s")
+
+    runner = run_streaming_pipeline if args.stream else run_pipeline
+    countries = args.countries or ["United Kingdom"]
+    frames = runner(
+        country_code=countries if len(countries) > 1 else countries[0],
+        sort_by=args.sort_by,
+        period_type=args.period,
+        max_items=args.max_items,
+        refresh=args.refresh,
+        output_dir=args.output_dir,
+        formats=tuple(args.formats or OUTPUT_FORMATS),
+    )
+    return 0 if "unsigned" in frames else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
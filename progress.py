@@ -0,0 +1,142 @@
+# progress.py
+
+import json
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# 📣 Pluggable progress output for the pipeline stages.
+# Stages call `log.write(...)`, `log.warning(...)` etc.; where that output goes (the Streamlit page,
+# Python logging, nowhere) depends on the active sink.
+
+
+class LoggingSink:
+    """Sends progress to Python logging. Used by headless runs and as the default."""
+
+    def __init__(self, logger: logging.Logger = None):
+        self.logger = logger or logging.getLogger("tiktok_pipeline")
+
+    def write(self, *args):
+        self.logger.info(" ".join(str(a) for a in args))
+
+    def debug(self, *args):
+        self.logger.debug(" ".join(str(a) for a in args))
+
+    def json(self, obj):
+        self.logger.debug(json.dumps(obj, default=str))
+
+    def success(self, message):
+        self.logger.info(message)
+
+    def warning(self, message):
+        self.logger.warning(message)
+
+    def error(self, message):
+        self.logger.error(message)
+
+
+class StreamlitSink:
+    """
+    Renders progress on the Streamlit page of the session that created it; debug output only
+    when `show_debug` is set. Worker threads writing to it are attached to that session's
+    script context, without which Streamlit drops their output.
+    """
+
+    def __init__(self, show_debug: bool = False):
+        import streamlit as st
+        try:
+            from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+        except ImportError:  # older Streamlit releases
+            add_script_run_ctx = get_script_run_ctx = None
+        self.st = st
+        self.show_debug = show_debug
+        self.ctx = get_script_run_ctx() if get_script_run_ctx else None
+        self._add_ctx = add_script_run_ctx
+
+    def _attach(self):
+        if self.ctx is not None:
+            self._add_ctx(threading.current_thread(), self.ctx)
+
+    def write(self, *args):
+        self._attach()
+        self.st.write(*args)
+
+    def debug(self, *args):
+        if self.show_debug:
+            self._attach()
+            self.st.write(*args)
+
+    def json(self, obj):
+        if self.show_debug:
+            self._attach()
+            self.st.json(obj)
+
+    def success(self, message):
+        self._attach()
+        self.st.success(message)
+
+    def warning(self, message):
+        self._attach()
+        self.st.warning(message)
+
+    def error(self, message):
+        self._attach()
+        self.st.error(message)
+
+
+_default_sink = LoggingSink()
+_local = threading.local()
+
+
+def get_sink():
+    return getattr(_local, "sink", None) or _default_sink
+
+
+def set_sink(sink) -> None:
+    """
+    Sets the process-wide sink used by threads without their own (see use_sink).
+    For headless use; per-session output (Streamlit) should go through use_sink.
+    """
+    global _default_sink
+    _default_sink = sink
+
+
+@contextmanager
+def use_sink(sink):
+    """Routes progress from the current thread to `sink` for the duration of the block."""
+    previous = getattr(_local, "sink", None)
+    _local.sink = sink
+    try:
+        yield sink
+    finally:
+        _local.sink = previous
+
+
+def _set_thread_sink(sink) -> None:
+    _local.sink = sink
+
+
+def sink_executor(**kwargs) -> ThreadPoolExecutor:
+    """ThreadPoolExecutor whose worker threads report to the calling thread's current sink."""
+    return ThreadPoolExecutor(initializer=_set_thread_sink, initargs=(get_sink(),), **kwargs)
+
+
+def bind_sink(fn):
+    """Wraps `fn` (e.g. a Thread target) to run with the calling thread's current sink."""
+    sink = get_sink()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with use_sink(sink):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class _SinkProxy:
+    def __getattr__(self, name):
+        return getattr(get_sink(), name)
+
+
+log = _SinkProxy()
@@ -0,0 +1,133 @@
+# sound_ranking.py
+
+import os
+import numpy as np
+import pandas as pd
+
+from progress import log
+from metrics import timed_stage
+from data_utils import canonical_video_id, parse_video_id, sound_key
+
+# 🏆 Per-sound aggregation of the video-level frames and top-N selection
+SOUND_TOP_N = int(os.getenv("SOUND_TOP_N", "50"))
+
+ENGAGEMENT_COLUMNS = ["Plays", "Diggs", "Shares", "Comments"]
+
+
+def sound_group_key(df: pd.DataFrame) -> pd.Series:
+    """TikTok's musicMeta ID where present, else the normalized title + artist."""
+    if "Music ID" not in df.columns:
+        return "key:" + sound_key(df["Music"], df["Music author"])
+    ids = df["Music ID"].astype("string").str.strip()
+    keys = ("id:" + ids.where(ids != "")).astype(object)
+    # Title + artist keys are only built for the rows without an ID
+    missing = keys.isna().to_numpy()
+    if missing.any():
+        keys[missing] = ("key:" + sound_key(df["Music"][missing], df["Music author"][missing])).to_numpy()
+    return keys
+
+
+def _video_keys(frame: pd.DataFrame) -> pd.Series:
+    # Pipeline frames carry the id of their URL in 'video_id', so the URLs aren't re-parsed per row
+    if "video_id" not in frame.columns:
+        return canonical_video_id(frame)
+    if pd.api.types.is_integer_dtype(frame["video_id"]):
+        return frame["video_id"]
+    return parse_video_id(frame["video_id"])
+
+
+def _region_spread(df: pd.DataFrame, codes: np.ndarray, n_sounds: int, video_df: pd.DataFrame = None) -> np.ndarray:
+    # Distinct regions per sound, from the trending frame's 'regions' / 'region' columns
+    if video_df is not None and not video_df.empty:
+        column = "regions" if "regions" in video_df.columns else "region"
+        if column not in video_df.columns:
+            return None
+        region_codes, combos = pd.factorize(video_df[column])
+        lookup = pd.Series(region_codes, index=_video_keys(video_df).to_numpy())
+        lookup = lookup[lookup.index.notna() & ~lookup.index.duplicated()]
+        positions = lookup.index.get_indexer(_video_keys(df).to_numpy())
+        region_codes = np.where(positions >= 0, lookup.to_numpy()[positions], -1)
+    elif "regions" in df.columns or "region" in df.columns:
+        region_codes, combos = pd.factorize(df["regions" if "regions" in df.columns else "region"])
+    else:
+        return None
+
+    # Region lists are split once per distinct value, then joined to the distinct (sound, value) pairs
+    pairs = pd.DataFrame({"sound": codes, "combo": region_codes})
+    pairs = pairs[pairs["combo"] >= 0].drop_duplicates()
+    split = pd.Series(combos, dtype="string").str.split(",").explode()
+    split = split[split.notna() & (split != "")]
+    regions = pd.DataFrame({"combo": split.index, "region": split.to_numpy()})
+    spread = pairs.merge(regions, on="combo")[["sound", "region"]].drop_duplicates()
+    return np.bincount(spread["sound"].to_numpy(), minlength=n_sounds)
+
+
+@timed_stage()
+def aggregate_sounds(df: pd.DataFrame, video_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Collapses a video-level frame (music / Spotify / unsigned stage) to one row per sound:
+    video count, total and median plays, engagement totals and ratios, and the number of
+    regions the sound trended in (taken from `video_df`'s 'regions' when given).
+    """
+    missing = [col for col in ("Music", "Music author") if col not in df.columns]
+    if missing:
+        raise ValueError(f"aggregate_sounds needs 'Music' and 'Music author' columns; missing {missing}")
+    if df.empty:
+        return pd.DataFrame()
+
+    df = df.reset_index(drop=True)
+    codes, keys = pd.factorize(sound_group_key(df), sort=False)
+
+    counts = pd.DataFrame({
+        name: pd.to_numeric(df[name], errors="coerce").astype("float64") if name in df.columns
+        else pd.Series(np.nan, index=df.index)
+        for name in ENGAGEMENT_COLUMNS
+    })
+    grouped = counts.groupby(codes, sort=False)
+    totals = grouped.sum(min_count=1)
+
+    sounds = pd.DataFrame({
+        "Sound Key": keys,
+        "Videos": np.bincount(codes, minlength=len(keys)),
+        "Total Plays": totals["Plays"].to_numpy(),
+        "Median Plays": grouped["Plays"].median().to_numpy(),
+        "Total Diggs": totals["Diggs"].to_numpy(),
+        "Total Shares": totals["Shares"].to_numpy(),
+        "Total Comments": totals["Comments"].to_numpy(),
+    })
+
+    plays = sounds["Total Plays"].where(sounds["Total Plays"] > 0)
+    sounds["Engagement Rate"] = (sounds[["Total Diggs", "Total Shares", "Total Comments"]].sum(axis=1) / plays)
+    sounds["Like Rate"] = sounds["Total Diggs"] / plays
+    sounds["Share Rate"] = sounds["Total Shares"] / plays
+
+    spread = _region_spread(df, codes, len(keys), video_df)
+    if spread is not None:
+        sounds["Regions"] = spread
+
+    # Descriptive columns from the first video of each sound (factorize numbers them in order of appearance)
+    first = np.unique(codes, return_index=True)[1]
+    descriptive = [c for c in ("Music", "Music author", "Music ID", "Label") if c in df.columns]
+    for col in descriptive:
+        sounds[col] = df[col].to_numpy()[first]
+
+    log.write(f"🏆 Aggregated {len(df)} videos into {len(sounds)} sounds.")
+    return sounds[descriptive + [c for c in sounds.columns if c not in descriptive]]
+
+
+def top_n_sounds(sounds: pd.DataFrame, n: int = SOUND_TOP_N, by: str = "Total Plays") -> pd.DataFrame:
+    """
+    The `n` highest-ranked sounds by `by`, in descending order. Uses a partial selection
+    (argpartition) so only the selected rows get sorted.
+    """
+    if sounds.empty or n <= 0:
+        return sounds.iloc[:0]
+
+    values = sounds[by].to_numpy(dtype="float64", na_value=np.nan)
+    values = np.where(np.isnan(values), -np.inf, values)
+    if n < len(values):
+        selected = np.argpartition(-values, n - 1)[:n]
+    else:
+        selected = np.arange(len(values))
+    order = selected[np.argsort(-values[selected], kind="stable")]
+    return sounds.iloc[order].reset_index(drop=True)
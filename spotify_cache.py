@@ -0,0 +1,132 @@
+# spotify_cache.py
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Optional
+
+from metrics import record_cache
+
+# 🗄️ Persistent label lookup cache (shared by the Streamlit pipeline and the Flask service)
+SPOTIFY_CACHE_PATH = os.getenv("SPOTIFY_CACHE_PATH", os.path.join(".cache", "spotify_labels.sqlite"))
+SPOTIFY_CACHE_TTL = int(os.getenv("SPOTIFY_CACHE_TTL", str(30 * 24 * 3600)))  # 30 days
+SPOTIFY_CACHE_NEGATIVE_TTL = int(os.getenv("SPOTIFY_CACHE_NEGATIVE_TTL", str(24 * 3600)))  # 1 day
+SPOTIFY_CACHE_MAX_ENTRIES = int(os.getenv("SPOTIFY_CACHE_MAX_ENTRIES", "50000"))
+SPOTIFY_CACHE_EVICT_INTERVAL = int(os.getenv("SPOTIFY_CACHE_EVICT_INTERVAL", "1000"))  # inserts between size checks
+
+
+def normalize_sound_key(title, artist) -> str:
+    """Case-folded, whitespace-collapsed (title, artist) key."""
+    def norm(value):
+        return " ".join(str(value).casefold().split()) if value is not None else ""
+    return f"{norm(title)}\x1f{norm(artist)}"
+
+
+class LabelCache:
+    """
+    SQLite-backed cache of Spotify lookup results keyed on a normalized (title, artist) pair.
+    "Unknown" results expire after `negative_ttl`, everything else after `ttl`.
+    The table size is checked every `evict_interval` inserts; once it has grown past
+    `max_entries`, the least recently fetched rows are evicted.
+    """
+
+    def __init__(self, path: str = SPOTIFY_CACHE_PATH, ttl: int = SPOTIFY_CACHE_TTL,
+                 negative_ttl: int = SPOTIFY_CACHE_NEGATIVE_TTL, max_entries: int = SPOTIFY_CACHE_MAX_ENTRIES,
+                 evict_interval: int = SPOTIFY_CACHE_EVICT_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.evict_interval = evict_interval
+        self.inserts_since_evict = 0
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS labels (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                negative INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS labels_fetched_at ON labels (fetched_at)")
+        self.conn.commit()
+
+    def get(self, title: str, artist: str) -> Optional[dict]:
+        key = normalize_sound_key(title, artist)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT result, negative, fetched_at FROM labels WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            record_cache("spotify_labels", misses=1)
+            return None
+
+        result, negative, fetched_at = row
+        ttl = self.negative_ttl if negative else self.ttl
+        if time.time() - fetched_at > ttl:
+            record_cache("spotify_labels", misses=1)
+            return None
+        record_cache("spotify_labels", hits=1)
+        return json.loads(result)
+
+    def set(self, title: str, artist: str, result: dict) -> None:
+        self.set_many([(title, artist, result)])
+
+    def set_many(self, entries: list) -> None:
+        """Stores [(title, artist, result), ...] in a single transaction."""
+        now = time.time()
+        rows = [
+            (normalize_sound_key(title, artist), json.dumps(result),
+             int(result.get("Label") in (None, "Unknown")), now)
+            for title, artist, result in entries
+        ]
+        if not rows:
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO labels (key, result, negative, fetched_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self.inserts_since_evict += len(rows)
+            if self.inserts_since_evict >= self.evict_interval:
+                self._evict()
+                self.inserts_since_evict = 0
+            self.conn.commit()
+
+    def _evict(self) -> None:
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM labels").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM labels WHERE key IN (SELECT key FROM labels ORDER BY fetched_at LIMIT ?)",
+                (overflow,),
+            )
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM labels")
+            self.conn.commit()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_label_cache() -> LabelCache:
+    """Process-wide cache instance, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LabelCache()
+        return _cache
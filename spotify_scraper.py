@@ -5,109 +5,374 @@ import base64
 import os
 import pandas as pd
 import time
-import streamlit as st
+import threading
+from progress import log, sink_executor
+from spotify_cache import get_label_cache
+from http_utils import http_get, http_post
+from data_utils import sound_key
+from metrics import registry, timed_stage
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET")
 
+# Overridable for local stand-ins (see benchmarks/)
+SPOTIFY_API_BASE = os.getenv("SPOTIFY_API_BASE", "https://api.spotify.com/v1")
+SPOTIFY_ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com")
+
+# Concurrency / rate limiting for bulk enrichment
+SPOTIFY_MAX_WORKERS = int(os.getenv("SPOTIFY_MAX_WORKERS", "8"))
+SPOTIFY_RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", "10"))  # requests per second
+SPOTIFY_MAX_RETRIES = 3
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. `acquire()` blocks until a request may be sent,
+    allowing short bursts of up to `capacity` requests. `pause(seconds)` holds back every
+    caller, e.g. for the Retry-After period of a 429.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    # No tokens accrue while paused
+                    elapsed = now - max(self.updated, self.blocked_until)
+                    self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0  # resume at the steady rate rather than with a burst
+
+
+rate_limiter = TokenBucket(SPOTIFY_RATE_LIMIT)
+
+
+def spotify_get(url: str, params: dict = None, limiter: TokenBucket = None, token: str = None) -> requests.Response:
+    """
+    GET against the Spotify Web API through the rate limiter.
+    Authenticates with `token` if given, else with the shared token, read for every request so
+    a refresh is picked up by all workers. Retries on 429 after pausing the whole limiter for the
+    `Retry-After` period Spotify asks for, and once on 401 with a fresh shared token.
+    """
+    limiter = limiter or rate_limiter
+    refreshed = False
+    for attempt in range(SPOTIFY_MAX_RETRIES + 1):
+        limiter.acquire()
+        bearer = token or token_manager.get_token()
+        res = http_get(url, headers={"Authorization": f"Bearer {bearer}"}, params=params, timeout=15)
+        if res.status_code == 401 and not refreshed:
+            # Token revoked or expired early: drop it (unless another worker already replaced it) and retry
+            refreshed = True
+            token_manager.invalidate(bearer)
+            token = None
+            continue
+        if res.status_code != 429 or attempt == SPOTIFY_MAX_RETRIES:
+            return res
+        registry.inc("spotify_rate_limited_total")
+        retry_after = res.headers.get("Retry-After")
+        # Hold back every worker sharing the limiter, not just this one
+        limiter.pause(float(retry_after) if retry_after else 2 ** attempt)
+    return res
+
+class SpotifyTokenManager:
+    """
+    Thread-safe cache for the client-credentials access token.
+    The token is reused until `refresh_margin` seconds before it expires; concurrent callers
+    that find it stale wait on one refresh instead of each requesting a new token.
+    """
+
+    def __init__(self, refresh_margin: int = 60):
+        self.refresh_margin = refresh_margin
+        self.token = None
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+
+    def get_token(self) -> str:
+        with self.lock:
+            if self.token is None or time.monotonic() >= self.expires_at - self.refresh_margin:
+                self.token, expires_in = self._request_token()
+                self.expires_at = time.monotonic() + expires_in
+            return self.token
+
+    def invalidate(self, token: str = None) -> None:
+        """Forgets the cached token; with `token`, only if that is still the cached one."""
+        with self.lock:
+            if token is None or token == self.token:
+                self.token = None
+
+    def _request_token(self):
+        auth_str = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
+        b64_auth_str = base64.b64encode(auth_str.encode()).decode()
+
+        headers = {
+            "Authorization": f"Basic {b64_auth_str}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+
+        data = {
+            "grant_type": "client_credentials"
+        }
+
+        response = http_post(f"{SPOTIFY_ACCOUNTS_URL}/api/token", headers=headers, data=data, timeout=15)
+        response.raise_for_status()
+        payload = response.json()
+        return payload["access_token"], float(payload.get("expires_in", 3600))
+
+
+token_manager = SpotifyTokenManager()
+
+
 def get_access_token() -> str:
-    auth_str = f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}"
-    b64_auth_str = base64.b64encode(auth_str.encode()).decode()
+    return token_manager.get_token()
 
-    headers = {
-        "Authorization": f"Basic {b64_auth_str}",
-        "Content-Type": "application/x-www-form-urlencoded",
-    }
 
-    data = {
-        "grant_type": "client_credentials"
-    }
+SPOTIFY_ALBUM_BATCH_SIZE = 20  # max ids accepted by GET /v1/albums
 
-    response = requests.post("https://accounts.spotify.com/api/token", headers=headers, data=data)
-    response.raise_for_status()
-    return response.json()["access_token"]
 
-def get_spotify_label(song_title: str, artist_name: str, token: str) -> dict:
-    headers = {
-        "Authorization": f"Bearer {token}"
+def _empty_result() -> dict:
+    return {
+        "Spotify Track": None,
+        "Spotify Artist": None,
+        "Album": None,
+        "Label": "Unknown"
     }
 
+
+def search_track(song_title: str, artist_name: str, token: str = None, limiter: TokenBucket = None) -> dict:
+    """
+    Phase 1: resolves a song to its best Spotify track match.
+    Returns the track fields plus the album id, or None when Spotify has no match.
+    Raises on request errors.
+    """
     query = f"{song_title} {artist_name}".strip()
-    search_url = "https://api.spotify.com/v1/search"
+    search_url = f"{SPOTIFY_API_BASE}/search"
     params = {"q": query, "type": "track", "limit": 1}
 
-    try:
-        search_res = requests.get(search_url, headers=headers, params=params)
-        search_res.raise_for_status()
-        items = search_res.json().get("tracks", {}).get("items", [])
+    search_res = spotify_get(search_url, params=params, limiter=limiter, token=token)
+    search_res.raise_for_status()
+    items = search_res.json().get("tracks", {}).get("items", [])
 
-        if not items:
-            return {
-                "Spotify Track": None,
-                "Spotify Artist": None,
-                "Album": None,
-                "Label": "Unknown"
-            }
+    if not items:
+        return None
 
-        track = items[0]
-        album = track.get("album", {})
-        album_id = album.get("id")
+    track = items[0]
+    album = track.get("album", {})
+    return {
+        "Spotify Track": track["name"],
+        "Spotify Artist": ", ".join([a["name"] for a in track["artists"]]),
+        "Album": album.get("name"),
+        "album_id": album.get("id"),
+    }
 
-        label = "Unknown"
-        album_name = album.get("name")
 
-        if album_id:
-            album_url = f"https://api.spotify.com/v1/albums/{album_id}"
-            album_res = requests.get(album_url, headers=headers)
-            if album_res.ok:
-                album_data = album_res.json()
-                label = album_data.get("label", "Unknown")
-
-        return {
-            "Spotify Track": track["name"],
-            "Spotify Artist": ", ".join([a["name"] for a in track["artists"]]),
-            "Album": album_name,
-            "Label": label
-        }
+def get_album_labels(album_ids: list, token: str = None, limiter: TokenBucket = None) -> dict:
+    """
+    Phase 2: fetches labels for up to 20 album ids with a single multi-album request.
+    Returns {album_id: label}; albums missing from the response are left out.
+    Raises on request errors.
+    """
+    album_res = spotify_get(
+        f"{SPOTIFY_API_BASE}/albums",
+        params={"ids": ",".join(album_ids)},
+        limiter=limiter,
+        token=token,
+    )
+    album_res.raise_for_status()
+
+    labels = {}
+    for album in album_res.json().get("albums", []):
+        if album and album.get("id"):
+            labels[album["id"]] = album.get("label") or "Unknown"
+    return labels
+
+
+def fetch_spotify_label(song_title: str, artist_name: str, token: str = None, limiter: TokenBucket = None) -> tuple:
+    """
+    Looks up the label for a track on Spotify, bypassing the cache.
+    Returns (result, complete); `complete` is False when a request failed, in which case the
+    result should not be cached.
+    """
+    query = f"{song_title} {artist_name}".strip()
 
+    try:
+        track = search_track(song_title, artist_name, token, limiter=limiter)
     except Exception as e:
-        st.warning(f"⚠️ Spotify lookup failed for: {query} — {str(e)}")
-        return {
-            "Spotify Track": None,
-            "Spotify Artist": None,
-            "Album": None,
-            "Label": "Unknown"
-        }
+        log.warning(f"⚠️ Spotify lookup failed for: {query} — {str(e)}")
+        return _empty_result(), False
 
+    result = _empty_result()
+    complete = True
 
-def enrich_with_spotify(df: pd.DataFrame) -> pd.DataFrame:
+    if track is not None:
+        album_id = track.pop("album_id")
+        result.update(track)
+        if album_id:
+            try:
+                result["Label"] = get_album_labels([album_id], token, limiter=limiter).get(album_id, "Unknown")
+            except Exception as e:
+                log.warning(f"⚠️ Spotify album lookup failed for: {query} — {str(e)}")
+                complete = False
+
+    return result, complete
+
+
+def get_spotify_label(song_title: str, artist_name: str, token: str = None, limiter: TokenBucket = None, use_cache: bool = True) -> dict:
     """
-    Accepts a DataFrame with 'Song Title' and 'Artist' columns and adds Spotify enrichment.
-    Skips rows with missing title/artist to avoid 400 errors.
+    Looks up the label for a track, consulting the persistent label cache first.
+    Uses the shared cached access token unless `token` is given.
+    Successful lookups (including "Unknown" results) are written back to the cache;
+    failed requests are not, so they are retried on the next run.
     """
-    token = get_access_token()
+    cache = get_label_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(song_title, artist_name)
+        if cached is not None:
+            return cached
 
-    results = []
-    for _, row in df.iterrows():
-        title = str(row.get("Song Title", "")).strip()
-        artist = str(row.get("Artist", "")).strip()
+    result, complete = fetch_spotify_label(song_title, artist_name, token=token, limiter=limiter)
+    if cache is not None and complete:
+        cache.set(song_title, artist_name, result)
+    return result
+
+
+def lookup_labels(pairs: list, max_workers: int = SPOTIFY_MAX_WORKERS, limiter: TokenBucket = None) -> list:
+    """
+    Resolves a list of (title, artist) pairs to Spotify results, in the same order.
+    Pairs with a missing title or artist are skipped to avoid 400 errors.
+
+    Runs in two phases on a worker pool behind `limiter` (default: the process-wide `rate_limiter`,
+    shared with every other lookup so concurrent runs stay within SPOTIFY_RATE_LIMIT):
+    tracks not already in the label cache are searched to resolve their album ids, then the
+    distinct album ids are fetched 20 at a time through the multi-album endpoint.
+    """
+    skipped = sum(1 for title, artist in pairs if not title or not artist)
+    if skipped:
+        log.warning(f"⚠️ Skipping {skipped} rows due to missing title or artist.")
 
+    cache = get_label_cache()
+    results = [_empty_result() for _ in pairs]
+    pending = []  # row positions that need a Spotify lookup
+    for pos, (title, artist) in enumerate(pairs):
         if not title or not artist:
-            st.warning("⚠️ Skipping row due to missing title or artist.")
-            results.append({
-                "Spotify Track": None,
-                "Spotify Artist": None,
-                "Album": None,
-                "Label": "Unknown"
-            })
             continue
+        cached = cache.get(title, artist)
+        if cached is not None:
+            results[pos] = cached
+        else:
+            pending.append(pos)
 
-        query = f"{title} {artist}"
-        st.write(f"🔍 Searching Spotify for: {query}")
+    log.write(f"🗄️ Label cache hits: {len(pairs) - skipped - len(pending)}")
+    if not pending:
+        return results
 
-        result = get_spotify_label(title, artist, token)
-        results.append(result)
-        time.sleep(0.2)  # avoid hitting rate limits
+    limiter = limiter or rate_limiter
+    workers = max(1, max_workers)
+
+    # Phase 1 – resolve tracks to album ids
+    log.write(f"🔍 Searching Spotify for {len(pending)} tracks ({workers} workers, {limiter.rate:g} req/s)...")
+
+    def search(pos):
+        title, artist = pairs[pos]
+        try:
+            return search_track(title, artist, limiter=limiter)
+        except Exception as e:
+            log.warning(f"⚠️ Spotify lookup failed for: {title} {artist} — {str(e)}")
+            return e
+
+    with sink_executor(max_workers=workers) as executor:
+        tracks = list(executor.map(search, pending))
+
+    # Phase 2 – fetch each distinct album once, 20 per request
+    album_ids = list(dict.fromkeys(
+        t["album_id"] for t in tracks if isinstance(t, dict) and t.get("album_id")
+    ))
+    batches = [album_ids[i:i + SPOTIFY_ALBUM_BATCH_SIZE] for i in range(0, len(album_ids), SPOTIFY_ALBUM_BATCH_SIZE)]
+    log.write(f"💿 Fetching labels for {len(album_ids)} albums in {len(batches)} requests...")
+
+    def fetch_albums(batch):
+        try:
+            return get_album_labels(batch, limiter=limiter)
+        except Exception as e:
+            log.warning(f"⚠️ Spotify album lookup failed — {str(e)}")
+            return None
+
+    labels = {}
+    failed_albums = set()
+    with sink_executor(max_workers=workers) as executor:
+        for batch, batch_labels in zip(batches, executor.map(fetch_albums, batches)):
+            if batch_labels is None:
+                failed_albums.update(batch)
+            else:
+                labels.update(batch_labels)
+
+    to_cache = []
+    for pos, track in zip(pending, tracks):
+        if isinstance(track, Exception):
+            continue
+
+        result = _empty_result()
+        album_id = None
+        if track is not None:
+            track = dict(track)
+            album_id = track.pop("album_id")
+            result.update(track)
+            if album_id:
+                result["Label"] = labels.get(album_id, "Unknown")
+        results[pos] = result
+
+        # Don't cache results whose album request failed; they'll be retried next run
+        if album_id not in failed_albums:
+            to_cache.append((*pairs[pos], result))
+
+    cache.set_many(to_cache)
+    return results
+
+
+@timed_stage()
+def enrich_with_spotify(df: pd.DataFrame, max_workers: int = SPOTIFY_MAX_WORKERS, limiter: TokenBucket = None) -> pd.DataFrame:
+    """
+    Accepts a DataFrame with 'Song Title' and 'Artist' columns and adds Spotify enrichment.
+    Rows are collapsed to unique normalized sounds first; each sound is looked up once and the
+    results are merged back onto every row. 'Sound Video Count' records how many rows share the sound.
+    """
+    df = df.reset_index(drop=True)
+    titles = df["Song Title"] if "Song Title" in df.columns else pd.Series("", index=df.index)
+    artists = df["Artist"] if "Artist" in df.columns else pd.Series("", index=df.index)
+
+    keyed = df.assign(sound_key=sound_key(titles, artists))
+    coverage = keyed["sound_key"].value_counts()
+    first = ~keyed["sound_key"].duplicated()
+    unique_keys = keyed.loc[first, "sound_key"]
+
+    log.write(f"🧮 {len(keyed)} rows → {len(unique_keys)} unique sounds ({len(keyed) - len(unique_keys)} duplicate lookups skipped)")
+
+    pairs = [
+        (str(title).strip() if pd.notna(title) else "", str(artist).strip() if pd.notna(artist) else "")
+        for title, artist in zip(titles[first], artists[first])
+    ]
+    results = lookup_labels(pairs, max_workers=max_workers, limiter=limiter)
 
     enrichment_df = pd.DataFrame(results)
-    return pd.concat([df.reset_index(drop=True), enrichment_df.reset_index(drop=True)], axis=1)
+    enrichment_df["sound_key"] = unique_keys.to_numpy()
+    enrichment_df["Sound Video Count"] = enrichment_df["sound_key"].map(coverage).to_numpy()
+
+    return keyed.merge(enrichment_df, on="sound_key", how="left").drop(columns="sound_key")
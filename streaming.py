@@ -0,0 +1,232 @@
+# streaming.py
+"""
+Streaming execution mode: the pipeline stages run concurrently, connected by bounded queues.
+Enriched records flow into music filtering, Spotify lookup and label filtering as soon as
+they appear in the Apify dataset, and unsigned candidates are yielded batch by batch.
+"""
+
+import queue
+import threading
+import pandas as pd
+from concurrent.futures import as_completed
+
+from progress import log, bind_sink, sink_executor
+from apify_utils import (
+    ENRICHMENT_ACTOR,
+    ENRICHMENT_MAX_CONCURRENT_RUNS,
+    ENRICHMENT_SHARD_RETRIES,
+    ENRICHMENT_SHARD_SIZE,
+    ENRICHMENT_TIMEOUT,
+    abort_actor_run,
+    build_enrichment_input,
+    iter_run_items,
+    start_actor_run,
+    valid_video_urls,
+)
+from enrichment_store import split_known_videos, store_records
+from data_utils import process_enriched_video_data, filter_music_only, extract_video_id
+from label_filter import filter_unsigned_tracks
+
+STREAM_QUEUE_SIZE = 4  # batches buffered between stages
+QUEUE_POLL_INTERVAL = 0.1  # seconds; how often blocked stages check for shutdown
+
+_DONE = object()
+
+
+class _StreamStopped(Exception):
+    pass
+
+
+class _ActiveRuns:
+    """Actor runs started by the stream, so they can be aborted if it is torn down early."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.run_ids = set()
+
+    def add(self, run_id: str) -> None:
+        with self.lock:
+            self.run_ids.add(run_id)
+
+    def discard(self, run_id: str) -> None:
+        with self.lock:
+            self.run_ids.discard(run_id)
+
+    def abort(self, run_id: str) -> None:
+        self.discard(run_id)
+        try:
+            abort_actor_run(run_id)
+            log.write(f"🛑 Aborted Apify run {run_id}")
+        except Exception as e:
+            log.warning(f"⚠️ Could not abort Apify run {run_id}: {e}")
+
+    def abort_all(self) -> None:
+        with self.lock:
+            run_ids = list(self.run_ids)
+        for run_id in run_ids:
+            self.abort(run_id)
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    # Blocking put that gives up once the stream is stopped; returns whether the item was queued
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=QUEUE_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=QUEUE_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _stream_shard(urls: list, out_q: queue.Queue, stop: threading.Event, runs: _ActiveRuns,
+                  received: set, timeout: float) -> None:
+    """
+    Runs the actor for one shard and puts its records on `out_q` page by page, adding the
+    video ids it has passed on to `received`. Raises if the run fails or the stream is stopped.
+    """
+    if stop.is_set():
+        raise _StreamStopped()
+    run = start_actor_run(ENRICHMENT_ACTOR, build_enrichment_input(urls))
+    runs.add(run["id"])
+    try:
+        if stop.is_set():
+            raise _StreamStopped()
+        for items in iter_run_items(run["id"], run["defaultDatasetId"], timeout=timeout):
+            batch = pd.DataFrame(store_records(pd.DataFrame(items)))
+            if not _put(out_q, batch, stop):
+                raise _StreamStopped()
+            if "webVideoUrl" in batch.columns:
+                received.update(extract_video_id(batch["webVideoUrl"]).dropna())
+    except _StreamStopped:
+        # The stream may have been torn down before this run was registered; abort it here too
+        runs.abort(run["id"])
+        raise
+    finally:
+        runs.discard(run["id"])
+
+
+def _enrichment_source(video_df: pd.DataFrame, out_q: queue.Queue, stop: threading.Event, runs: _ActiveRuns,
+                       shard_size: int, timeout: float, max_concurrent_runs: int, retries: int) -> None:
+    """
+    Puts raw enriched record batches on `out_q`: stored records first, then live actor output.
+    Runs at most `max_concurrent_runs` shards at once; a failed shard is retried (up to `retries`
+    more times) for the URLs whose records had not arrived yet, so nothing is emitted twice.
+    """
+    try:
+        records, to_fetch = split_known_videos(video_df)
+        if records and not _put(out_q, pd.DataFrame(records), stop):
+            return
+
+        urls = valid_video_urls(to_fetch)
+        pending = [urls[i:i + shard_size] for i in range(0, len(urls), shard_size)]
+        if pending:
+            log.write(f"🧩 Streaming {len(urls)} URLs in {len(pending)} shards ({max_concurrent_runs} concurrent runs)...")
+
+        for attempt in range(retries + 1):
+            failed = []
+            with sink_executor(max_workers=max(1, max_concurrent_runs)) as executor:
+                futures = {}
+                for shard in pending:
+                    received = set()
+                    futures[executor.submit(_stream_shard, shard, out_q, stop, runs, received, timeout)] = (shard, received)
+                for future in as_completed(futures):
+                    shard, received = futures[future]
+                    try:
+                        future.result()
+                    except _StreamStopped:
+                        continue
+                    except Exception as e:
+                        ids = extract_video_id(pd.Series(shard, dtype="string"))
+                        remaining = [url for url, video_id in zip(shard, ids) if pd.isna(video_id) or video_id not in received]
+                        log.warning(f"⚠️ Enrichment shard failed (attempt {attempt + 1}), "
+                                    f"{len(remaining)} of {len(shard)} URLs outstanding: {e}")
+                        if remaining:
+                            failed.append(remaining)
+            if stop.is_set():
+                return
+            pending = failed
+            if not pending:
+                break
+
+        if pending:
+            lost = sum(len(shard) for shard in pending)
+            log.error(f"❌ {len(pending)} shards ({lost} URLs) failed after {retries + 1} attempts.")
+    except Exception as e:
+        _put(out_q, e, stop)
+    finally:
+        _put(out_q, _DONE, stop)
+
+
+def _stage(fn, in_q: queue.Queue, out_q: queue.Queue, stop: threading.Event) -> None:
+    """Applies `fn` to each batch from `in_q`; empty results are dropped, errors passed downstream."""
+    while True:
+        batch = _get(in_q, stop)
+        if batch is _DONE:
+            _put(out_q, _DONE, stop)
+            return
+        if isinstance(batch, Exception):
+            _put(out_q, batch, stop)
+            continue
+        try:
+            result = fn(batch)
+        except Exception as e:
+            _put(out_q, e, stop)
+            continue
+        if result is not None and not result.empty:
+            _put(out_q, result, stop)
+
+
+def _process_batch(raw_df: pd.DataFrame) -> pd.DataFrame:
+    return filter_music_only(process_enriched_video_data(raw_df))
+
+
+def stream_unsigned_tracks(video_df: pd.DataFrame, queue_size: int = STREAM_QUEUE_SIZE,
+                           shard_size: int = ENRICHMENT_SHARD_SIZE,
+                           timeout: float = ENRICHMENT_TIMEOUT,
+                           max_concurrent_runs: int = ENRICHMENT_MAX_CONCURRENT_RUNS,
+                           retries: int = ENRICHMENT_SHARD_RETRIES):
+    """
+    Yields DataFrames of unsigned / unknown-label candidates as they are found.
+
+    Stages: enrichment (stored records + live Apify dataset pages) → flatten & music filter →
+    Spotify lookup → label filter. Each runs in its own thread and hands batches on through a
+    queue of at most `queue_size` batches, so a slow stage applies backpressure upstream.
+    Raises the first stage error once the batches before it have been yielded. When the
+    generator is closed or raises, the stages are stopped and unfinished actor runs aborted.
+    """
+    # Imported here to avoid a cycle: pipeline imports this module for --stream
+    from pipeline import enrich_music_with_spotify
+
+    stop = threading.Event()
+    runs = _ActiveRuns()
+    raw_q, music_q, spotify_q, out_q = (queue.Queue(maxsize=queue_size) for _ in range(4))
+    threads = [
+        threading.Thread(target=bind_sink(_enrichment_source), daemon=True, args=(
+            video_df, raw_q, stop, runs, shard_size, timeout, max_concurrent_runs, retries)),
+        threading.Thread(target=bind_sink(_stage), args=(_process_batch, raw_q, music_q, stop), daemon=True),
+        threading.Thread(target=bind_sink(_stage), args=(enrich_music_with_spotify, music_q, spotify_q, stop), daemon=True),
+        threading.Thread(target=bind_sink(_stage), args=(filter_unsigned_tracks, spotify_q, out_q, stop), daemon=True),
+    ]
+    for t in threads:
+        t.start()
+
+    try:
+        while True:
+            batch = out_q.get()
+            if batch is _DONE:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+            yield batch
+    finally:
+        stop.set()
+        runs.abort_all()
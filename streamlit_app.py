@@ -1,133 +1,199 @@
-import streamlit as st
-import pandas as pd
 import time
 
-from apify_utils import run_trending_scraper, run_video_comment_scraper
-from data_utils import (
-    process_raw_data,
-    process_enriched_video_data,
-    merge_video_and_song_data,
-    filter_music_only
-)
-from spotify_scraper import enrich_with_spotify
-from label_filter import filter_unsigned_tracks
+_import_started = time.perf_counter()
+
+import streamlit as st
+from types import SimpleNamespace
+
+from markets import COUNTRY_CODES
+from progress import StreamlitSink, use_sink
+from metrics import registry, cache_hit_rates
+
+# Only what the first paint needs is imported above; pandas, the Apify/Spotify clients and the
+# pipeline stages are loaded by load_pipeline() the first time a step button is pressed
+STARTUP_IMPORT_SECONDS = time.perf_counter() - _import_started
 
 st.set_page_config(page_title="TikTok Trending Discovery", layout="wide")
 
+
+@st.cache_resource
+def startup_timings() -> dict:
+    # The first run in the process records the cold import time; reruns reuse this dict
+    return {"imports": STARTUP_IMPORT_SECONDS}
+
+
+@st.cache_resource(show_spinner="Loading pipeline...")
+def load_pipeline() -> SimpleNamespace:
+    """Imports the pipeline stages once per process; kept across reruns and sessions."""
+    started = time.perf_counter()
+
+    from trending import fetch_trending_fanout
+    from enrichment_store import enrich_videos_incremental
+    from data_utils import process_enriched_video_data, filter_music_only, compact_frame
+    from pipeline import enrich_music_with_spotify
+    from label_filter import filter_unsigned_tracks
+    from trend_history import append_snapshot, rank_with_history
+    from sound_ranking import aggregate_sounds, top_n_sounds
+
+    startup_timings()["pipeline"] = time.perf_counter() - started
+    return SimpleNamespace(
+        fetch_trending_fanout=fetch_trending_fanout,
+        enrich_videos_incremental=enrich_videos_incremental,
+        process_enriched_video_data=process_enriched_video_data,
+        filter_music_only=filter_music_only,
+        compact_frame=compact_frame,
+        enrich_music_with_spotify=enrich_music_with_spotify,
+        filter_unsigned_tracks=filter_unsigned_tracks,
+        append_snapshot=append_snapshot,
+        rank_with_history=rank_with_history,
+        aggregate_sounds=aggregate_sounds,
+        top_n_sounds=top_n_sounds,
+    )
+
+
 st.title("🎵 TikTok Trending Discovery Tool")
 st.markdown("This tool pulls the top trending TikTok **videos**, extracts the **songs used**, enriches them via **Spotify**, and filters for **unsigned tracks**.")
 
 # Sidebar: Scraper Settings
 st.sidebar.header("📊 Scraper Settings")
 
-country = st.sidebar.selectbox("🌍 Country", ["United Kingdom", "United States", "France", "Germany"])
+countries = st.sidebar.multiselect("🌍 Countries", list(COUNTRY_CODES), default=["United Kingdom"])
 sort_by = st.sidebar.selectbox("🔥 Sort By", ["hot", "likes", "comments", "shares"])
 period = st.sidebar.selectbox("🕒 Period Type", ["last 7 days", "last 30 days"])
 max_items = st.sidebar.slider("🔢 Max Items", min_value=5, max_value=100, value=10, step=5)
-
-# Step 1 – Scrape trending TikTok videos
-if st.button("1⃣ Fetch Trending Videos"):
-    with st.spinner("Fetching trending TikTok videos..."):
-        raw_df = run_trending_scraper(
-            country_code=country,
-            sort_by=sort_by,
-            period_type=period,
-            max_items=max_items
-        )
-
-    if raw_df is None or raw_df.empty:
-        st.error("❌ No data returned from Apify.")
+use_cache = st.sidebar.checkbox("♻️ Reuse recent results", value=True)
+momentum_days = st.sidebar.slider("📈 Momentum window (days)", min_value=1, max_value=30, value=7)
+show_debug = st.sidebar.checkbox("🐞 Show debug output", value=False)
+
+# Pipeline stages (and their worker threads) report progress to this session's page only
+with use_sink(StreamlitSink(show_debug=show_debug)):
+    # Step 1 – Scrape trending TikTok videos
+    if st.button("1⃣ Fetch Trending Videos"):
+        p = load_pipeline()
+        with st.spinner("Fetching trending TikTok videos..."):
+            video_df = p.fetch_trending_fanout(
+                countries=countries,
+                sort_modes=[sort_by],
+                periods=[period],
+                max_items=max_items,
+                refresh=not use_cache
+            )
+
+        if video_df is None or video_df.empty:
+            st.error("❌ No data returned from Apify.")
+        else:
+            video_df = p.compact_frame(video_df)
+            st.session_state["video_df"] = video_df
+            st.success(f"✅ Loaded {len(video_df)} trending videos.")
+
+            # Table – All trending videos
+            st.subheader("🎥 Trending Videos")
+            st.dataframe(video_df)
+
+    # Step 2 – Enrich with video sound metadata and filter for music
+    if "video_df" in st.session_state and st.button("2⃣ Enrich Sound Metadata"):
+        p = load_pipeline()
+        with st.spinner("Enriching with sound metadata via Apify..."):
+            enriched_df = p.enrich_videos_incremental(st.session_state["video_df"])
+
+        if enriched_df is None or enriched_df.empty:
+            st.error("❌ Enrichment failed or returned no data.")
+        else:
+            # Keep only the flattened columns; the raw Apify payload is dropped here
+            clean_enriched_df = p.compact_frame(p.process_enriched_video_data(enriched_df))
+            del enriched_df
+            p.append_snapshot(clean_enriched_df)
+            st.session_state["enriched_df"] = clean_enriched_df
+
+            st.success(f"✅ Enriched {len(clean_enriched_df)} videos.")
+
+            # Show all enriched videos (flattened columns)
+            columns_to_show = [
+                "Author", "Text", "Diggs", "Shares", "Plays", "Comments",
+                "Duration (seconds)", "Music", "Music author"
+            ]
+            st.subheader("🎬 All Enriched Videos")
+            st.dataframe(clean_enriched_df[columns_to_show])
+
+            # Filter music-only subset
+            music_df = p.filter_music_only(clean_enriched_df)
+            st.session_state["music_df"] = music_df
+
+            st.success(f"✅ Filtered {len(music_df)} music-based videos.")
+            st.subheader("🎶 Videos with Music")
+            st.dataframe(music_df[columns_to_show])
+
+    # Step 3 – Enrich with Spotify metadata (only music videos)
+    if "music_df" in st.session_state and st.button("3⃣ Enrich with Spotify"):
+        p = load_pipeline()
+        with st.spinner("Querying Spotify..."):
+            display_df = p.compact_frame(p.enrich_music_with_spotify(st.session_state["music_df"]))
+
+            st.session_state["spotify_df"] = display_df
+            st.success("✅ Spotify enrichment complete.")
+
+            display_cols = [
+                "Music", "Music author", "Label", 
+                "Diggs", "Shares", "Plays", "Comments"
+            ]
+            try:
+                spotify_display_df = display_df[display_cols]
+                st.subheader("🎧 Enriched Songs with Labels")
+                st.dataframe(spotify_display_df)
+            except KeyError as e:
+                st.warning(f"⚠️ Could not find expected display columns. {e}")
+                st.dataframe(display_df)
+
+
+    # Step 4 – Filter unsigned songs
+    if "spotify_df" in st.session_state and st.button("4️⃣ Show Unsigned Songs"):
+        p = load_pipeline()
+        with st.spinner("Filtering for unsigned or unknown-label songs..."):
+            unsigned_df = p.rank_with_history(p.filter_unsigned_tracks(st.session_state["spotify_df"]),
+                                              window=f"{momentum_days}D")
+            st.session_state["unsigned_df"] = unsigned_df
+
+            st.success(f"🆓 Found {len(unsigned_df)} unsigned or unknown-label songs.")
+            st.subheader("🆓 Unsigned or Unknown-Label Songs")
+
+            # ✅ Re-define display_cols here
+            display_cols = [
+                "Music", "Music author", "Label", 
+                "Diggs", "Shares", "Plays", "Comments"
+            ]
+            display_cols += [c for c in ("Momentum (plays/h)", "Growth rate", "Acceleration") if c in unsigned_df.columns]
+
+            unsigned_display_df = unsigned_df[display_cols]
+            st.dataframe(unsigned_display_df)
+
+            csv = unsigned_display_df.to_csv(index=False).encode("utf-8")
+            st.download_button("⬇️ Download Unsigned Songs CSV", csv, "unsigned_tiktok_songs.csv", "text/csv")
+
+            # Per-sound view: one row per sound across all the videos that use it
+            top_sounds_df = p.top_n_sounds(p.aggregate_sounds(unsigned_df, video_df=st.session_state.get("video_df")))
+            st.subheader("🏆 Top Unsigned Sounds")
+            st.dataframe(top_sounds_df.drop(columns="Sound Key", errors="ignore"))
+
+            csv = top_sounds_df.to_csv(index=False).encode("utf-8")
+            st.download_button("⬇️ Download Top Sounds CSV", csv, "top_unsigned_sounds.csv", "text/csv")
+
+
+# Diagnostics – stage timings, upstream HTTP calls and cache hit rates (process-wide)
+with st.sidebar.expander("📈 Diagnostics"):
+    hit_rates = cache_hit_rates()
+    for cache_name, rate in sorted(hit_rates.items()):
+        st.metric(f"{cache_name} cache hit rate", f"{rate:.0%}")
+
+    metric_rows = registry.snapshot()
+    if metric_rows:
+        for row in metric_rows:
+            row["labels"] = ", ".join(f"{k}={v}" for k, v in row["labels"].items())
+        st.dataframe(metric_rows, hide_index=True)
     else:
-        video_df = process_raw_data(raw_df)
-        st.session_state["video_df"] = video_df
-        st.success(f"✅ Loaded {len(video_df)} trending videos.")
-
-        # Table – All trending videos
-        st.subheader("🎥 Trending Videos")
-        st.dataframe(video_df)
-
-# Step 2 – Enrich with video sound metadata and filter for music
-if "video_df" in st.session_state and st.button("2⃣ Enrich Sound Metadata"):
-    video_urls = st.session_state["video_df"]["video_url"].tolist()
-    with st.spinner("Enriching with sound metadata via Apify..."):
-        enriched_df = run_video_comment_scraper(video_urls)
-
-    if enriched_df is None or enriched_df.empty:
-        st.error("❌ Enrichment failed or returned no data.")
-    else:
-        clean_enriched_df = process_enriched_video_data(enriched_df)
-        st.session_state["enriched_df"] = clean_enriched_df
-
-        st.success(f"✅ Enriched {len(clean_enriched_df)} videos.")
-
-        # Show all enriched videos (flattened columns)
-        columns_to_show = [
-            "Author", "Text", "Diggs", "Shares", "Plays", "Comments",
-            "Duration (seconds)", "Music", "Music author"
-        ]
-        st.subheader("🎬 All Enriched Videos")
-        st.dataframe(clean_enriched_df[columns_to_show])
-
-        # Filter music-only subset
-        music_df = filter_music_only(clean_enriched_df)
-        st.session_state["music_df"] = music_df
-
-        st.success(f"✅ Filtered {len(music_df)} music-based videos.")
-        st.subheader("🎶 Videos with Music")
-        st.dataframe(music_df[columns_to_show])
-
-# Step 3 – Enrich with Spotify metadata (only music videos)
-if "music_df" in st.session_state and st.button("3⃣ Enrich with Spotify"):
-    with st.spinner("Querying Spotify..."):
-        spotify_input_df = st.session_state["music_df"].rename(
-            columns={
-                "Music": "Song Title",
-                "Music author": "Artist"
-            }
-        )
-        spotify_df = enrich_with_spotify(spotify_input_df)
-
-        # Rename back for display purposes
-        display_df = spotify_df.rename(
-            columns={
-                "Song Title": "Music",
-                "Artist": "Music author"
-            }
-        )
-
-        st.session_state["spotify_df"] = display_df
-        st.success("✅ Spotify enrichment complete.")
-
-        display_cols = [
-            "Music", "Music author", "Label", 
-            "diggCount", "shareCount", "playCount", "commentCount"
-        ]
-        try:
-            spotify_display_df = display_df[display_cols]
-            st.subheader("🎧 Enriched Songs with Labels")
-            st.dataframe(spotify_display_df)
-        except KeyError as e:
-            st.warning(f"⚠️ Could not find expected display columns. {e}")
-            st.dataframe(display_df)
-
-
-# Step 4 – Filter unsigned songs
-if "spotify_df" in st.session_state and st.button("4️⃣ Show Unsigned Songs"):
-    with st.spinner("Filtering for unsigned or unknown-label songs..."):
-        unsigned_df = filter_unsigned_tracks(st.session_state["spotify_df"])
-        st.session_state["unsigned_df"] = unsigned_df
-
-        st.success(f"🆓 Found {len(unsigned_df)} unsigned or unknown-label songs.")
-        st.subheader("🆓 Unsigned or Unknown-Label Songs")
-
-        # ✅ Re-define display_cols here
-        display_cols = [
-            "Music", "Music author", "Label", 
-            "diggCount", "shareCount", "playCount", "commentCount"
-        ]
-
-        unsigned_display_df = unsigned_df[display_cols]
-        st.dataframe(unsigned_display_df)
-
-        csv = unsigned_display_df.to_csv(index=False).encode("utf-8")
-        st.download_button("⬇️ Download Unsigned Songs CSV", csv, "unsigned_tiktok_songs.csv", "text/csv")
+        st.caption("No metrics recorded yet.")
+
+timings = startup_timings()
+startup_caption = f"⏱️ Startup imports: {timings['imports']:.2f}s"
+if "pipeline" in timings:
+    startup_caption += f" · pipeline load: {timings['pipeline']:.2f}s"
+st.sidebar.caption(startup_caption)
@@ -0,0 +1,209 @@
+# trend_history.py
+
+import os
+import uuid
+import pandas as pd
+
+from progress import log
+from metrics import timed_stage
+from data_utils import canonical_video_id, sound_key
+
+# 📈 Append-only engagement history, partitioned by the date the counts were scraped
+#   <TREND_HISTORY_DIR>/date=YYYY-MM-DD/part-<time>-<id>.parquet
+TREND_HISTORY_DIR = os.getenv("TREND_HISTORY_DIR", "trend_history")
+
+COUNT_COLUMNS = ["Plays", "Diggs", "Shares", "Comments"]
+SNAPSHOT_COLUMNS = ["snapshot_time", "video_id", "sound_key", "Music", "Music author"] + COUNT_COLUMNS
+
+
+@timed_stage()
+def append_snapshot(enriched_df: pd.DataFrame, snapshot_time: pd.Timestamp = None,
+                    history_dir: str = TREND_HISTORY_DIR) -> list:
+    """
+    Appends the counts from a process_enriched_video_data frame to the history. Each row is
+    timed by when its counts were scraped ('Fetched At', set by the enrichment store), falling
+    back to `snapshot_time` (default: now); observations already in the history are skipped, so
+    rerunning on stored records adds nothing. Existing files are never rewritten.
+    Returns the written paths, one per date partition.
+    """
+    default_time = pd.Timestamp.now(tz="UTC") if snapshot_time is None else _utc(snapshot_time)
+
+    def column(name):
+        return enriched_df[name] if name in enriched_df.columns else pd.Series(pd.NA, index=enriched_df.index)
+
+    times = pd.to_datetime(column("Fetched At"), utc=True).fillna(default_time).dt.floor("ms")
+    snapshot = pd.DataFrame({
+        "snapshot_time": times,
+        "video_id": canonical_video_id(enriched_df),
+        "sound_key": sound_key(column("Music"), column("Music author")),
+        "Music": column("Music").astype("string"),
+        "Music author": column("Music author").astype("string"),
+        **{name: pd.to_numeric(column(name), errors="coerce").astype("Int64") for name in COUNT_COLUMNS},
+    }, index=enriched_df.index)
+    snapshot = snapshot.dropna(subset=["video_id"]).drop_duplicates("video_id")
+    snapshot = snapshot.astype({"video_id": "int64"})
+
+    # Records served from the enrichment store were snapshotted when they were fetched
+    if not snapshot.empty:
+        seen = load_history(start=snapshot["snapshot_time"].min(), end=snapshot["snapshot_time"].max(),
+                            columns=["video_id"], history_dir=history_dir)
+        if not seen.empty:
+            seen_keys = pd.MultiIndex.from_frame(seen[["video_id", "snapshot_time"]].astype({"video_id": "int64"}))
+            known = pd.MultiIndex.from_frame(snapshot[["video_id", "snapshot_time"]]).isin(seen_keys)
+            snapshot = snapshot[~known]
+    if snapshot.empty:
+        log.debug("📈 No new engagement observations to record.")
+        return []
+
+    paths = []
+    for day, part in snapshot.groupby(snapshot["snapshot_time"].dt.strftime("%Y-%m-%d"), sort=True):
+        partition = os.path.join(history_dir, f"date={day}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"part-{default_time:%H%M%S}-{uuid.uuid4().hex[:8]}.parquet")
+        part.to_parquet(path + ".tmp", index=False, engine="pyarrow")
+        os.replace(path + ".tmp", path)
+        paths.append(path)
+    log.write(f"📈 Recorded engagement snapshot for {len(snapshot)} videos.")
+    return paths
+
+
+def load_history(start=None, end=None, columns=None, history_dir: str = TREND_HISTORY_DIR) -> pd.DataFrame:
+    """
+    Reads snapshots taken between `start` and `end` (timestamps, UTC). Date partitions outside
+    the range are skipped without being opened; `columns` limits what is read from each file.
+    """
+    if not os.path.isdir(history_dir) or not any(name.startswith("date=") for name in os.listdir(history_dir)):
+        return pd.DataFrame(columns=columns or SNAPSHOT_COLUMNS)
+
+    start = _utc(start)
+    end = _utc(end)
+
+    filters = []
+    if start is not None:
+        filters.append(("date", ">=", f"{start:%Y-%m-%d}"))
+    if end is not None:
+        filters.append(("date", "<=", f"{end:%Y-%m-%d}"))
+
+    read_columns = None
+    if columns is not None:
+        read_columns = list(dict.fromkeys(["snapshot_time", *columns]))
+
+    history = pd.read_parquet(history_dir, engine="pyarrow", columns=read_columns, filters=filters or None)
+    history = history.drop(columns="date", errors="ignore")
+
+    # Partitions are whole days; trim to the exact window
+    if start is not None:
+        history = history[history["snapshot_time"] >= start]
+    if end is not None:
+        history = history[history["snapshot_time"] <= end]
+    return history.reset_index(drop=True)
+
+
+def _utc(value):
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    return value.tz_localize("UTC") if value.tzinfo is None else value.tz_convert("UTC")
+
+
+def _change_per_key(history: pd.DataFrame, key: str, metric: str) -> pd.DataFrame:
+    # First and last observation per key; history must be sorted by (key, snapshot_time)
+    grouped = history.groupby(key, sort=False)
+    ends = grouped.agg(
+        snapshots=(metric, "size"),
+        first_time=("snapshot_time", "first"),
+        last_time=("snapshot_time", "last"),
+        first=(metric, "first"),
+        last=(metric, "last"),
+    )
+    hours = (ends["last_time"] - ends["first_time"]).dt.total_seconds() / 3600
+    delta = (ends["last"] - ends["first"]).astype("float64")
+    ends["delta"] = delta
+    ends["velocity_per_hour"] = (delta / hours).where(hours > 0)
+    ends["growth_rate"] = (delta / ends["first"].astype("float64")).where(ends["first"] > 0)
+    return ends
+
+
+def _video_changes(history: pd.DataFrame, metric: str) -> pd.DataFrame:
+    # Only videos observed at two different times have a change to report
+    ends = _change_per_key(history, "video_id", metric)
+    return ends[ends["last_time"] > ends["first_time"]]
+
+
+@timed_stage()
+def engagement_velocity(history: pd.DataFrame, window: str = "7D", level: str = "sound",
+                        metric: str = "Plays", now=None) -> pd.DataFrame:
+    """
+    Growth over the trailing `window` per video (`level="video"`) or per sound (`level="sound"`).
+
+    Changes are always measured per video, between its first and last snapshot in the window;
+    videos seen only once are left out. A sound's `delta`, `velocity_per_hour` and
+    `acceleration` are the sums over its videos, and its `growth_rate` is the summed delta
+    over the summed starting values, so videos that only turn up in a later scrape don't count
+    as growth. `acceleration` is the velocity in the recent half of the window minus the earlier
+    half, positive for videos / sounds that are still speeding up.
+    """
+    now = pd.Timestamp.now(tz="UTC") if now is None else _utc(now)
+    window = pd.Timedelta(window)
+    cutoff = now - window
+
+    columns = ["video_id", "snapshot_time", metric] + (["sound_key"] if level == "sound" else [])
+    recent = history[(history["snapshot_time"] >= cutoff) & (history["snapshot_time"] <= now)]
+    recent = (
+        recent[columns].dropna(subset=["video_id", metric])
+        .drop_duplicates(["video_id", "snapshot_time"])
+        .sort_values(["video_id", "snapshot_time"], kind="stable")
+    )
+
+    videos = _video_changes(recent, metric)
+    midpoint = cutoff + window / 2
+    early = _video_changes(recent[recent["snapshot_time"] <= midpoint], metric)["velocity_per_hour"]
+    late = _video_changes(recent[recent["snapshot_time"] >= midpoint], metric)["velocity_per_hour"]
+    videos = videos.assign(acceleration=late.sub(early).reindex(videos.index))
+
+    if level != "sound":
+        return videos.drop(columns=["first_time", "last_time"])
+
+    videos = videos.assign(sound_key=recent.groupby("video_id", sort=False)["sound_key"].last().reindex(videos.index))
+    grouped = videos.groupby("sound_key", sort=False)
+    sounds = grouped.agg(
+        videos=("delta", "size"),
+        first=("first", "sum"),
+        last=("last", "sum"),
+        delta=("delta", "sum"),
+        velocity_per_hour=("velocity_per_hour", "sum"),
+    )
+    sounds["acceleration"] = grouped["acceleration"].sum(min_count=1)
+    sounds["growth_rate"] = (sounds["delta"] / sounds["first"].astype("float64")).where(sounds["first"] > 0)
+    return sounds
+
+
+def rank_by_momentum(df: pd.DataFrame, velocity: pd.DataFrame, by: str = "velocity_per_hour") -> pd.DataFrame:
+    """
+    Orders a song frame (with 'Music' / 'Music author') by the momentum of its sound from
+    engagement_velocity(level="sound"). Sounds without history sort last.
+    """
+    keys = sound_key(df["Music"], df["Music author"])
+    momentum = velocity[["velocity_per_hour", "growth_rate", "acceleration"]].rename(columns={
+        "velocity_per_hour": "Momentum (plays/h)",
+        "growth_rate": "Growth rate",
+        "acceleration": "Acceleration",
+    })
+    ranked = df.assign(**{col: keys.map(momentum[col]).to_numpy() for col in momentum.columns})
+    sort_column = {"velocity_per_hour": "Momentum (plays/h)", "growth_rate": "Growth rate",
+                   "acceleration": "Acceleration"}[by]
+    return ranked.sort_values(sort_column, ascending=False, na_position="last", kind="stable")
+
+
+def rank_with_history(df: pd.DataFrame, window: str = "7D", by: str = "velocity_per_hour",
+                      history_dir: str = TREND_HISTORY_DIR) -> pd.DataFrame:
+    """Loads the last `window` of sound-level history and ranks `df` by momentum (unchanged if no history)."""
+    if df.empty:
+        return df
+    now = pd.Timestamp.now(tz="UTC")
+    history = load_history(start=now - pd.Timedelta(window), columns=["video_id", "sound_key", "Plays"], history_dir=history_dir)
+    if history.empty:
+        log.debug("📈 No engagement history yet; keeping the original order.")
+        return df
+    velocity = engagement_velocity(history, window=window, level="sound", now=now)
+    return rank_by_momentum(df, velocity, by=by)
@@ -0,0 +1,163 @@
+# trending.py
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import itertools
+import pandas as pd
+from progress import log, sink_executor
+
+from apify_utils import run_trending_scraper, load_trending_dataset
+from data_utils import process_raw_data
+from metrics import record_cache, timed_stage
+
+# 🗄️ Cache of processed trending scrapes, keyed on the scraper parameters
+TRENDING_CACHE_DIR = os.getenv("TRENDING_CACHE_DIR", os.path.join(".cache", "trending"))
+TRENDING_CACHE_MAX_AGE = int(os.getenv("TRENDING_CACHE_MAX_AGE", "3600"))  # seconds
+
+# Trending scrapes run at once by fetch_trending_fanout
+TRENDING_MAX_PARALLEL = int(os.getenv("TRENDING_MAX_PARALLEL", "5"))
+
+
+def cache_key(country_code: str, sort_by: str, period_type: str, max_items: int) -> str:
+    params = {"country": country_code, "sort": sort_by, "period": period_type, "max_items": int(max_items)}
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _paths(key: str):
+    base = os.path.join(TRENDING_CACHE_DIR, key)
+    return base + ".parquet", base + ".json"
+
+
+def _read_meta(meta_path: str):
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_entry(key: str, video_df: pd.DataFrame, meta: dict) -> None:
+    data_path, meta_path = _paths(key)
+    os.makedirs(TRENDING_CACHE_DIR, exist_ok=True)
+
+    # Write to temp files and swap in, so readers never see a half-written entry. Each writer gets
+    # its own temp names: sessions fetching the same parameters at once would otherwise share them
+    suffix = f".{uuid.uuid4().hex[:8]}.tmp"
+    video_df.to_parquet(data_path + suffix, index=False)
+    os.replace(data_path + suffix, data_path)
+    with open(meta_path + suffix, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(meta_path + suffix, meta_path)
+
+
+@timed_stage()
+def fetch_trending_videos(country_code="United Kingdom", sort_by="hot", period_type="last 7 days", max_items=10,
+                          max_age: int = TRENDING_CACHE_MAX_AGE, refresh: bool = False) -> pd.DataFrame:
+    """
+    Returns the processed trending-video frame (see process_raw_data) for these parameters.
+
+    Entries younger than `max_age` seconds are served from the Parquet cache. If the Parquet file
+    is missing but the entry is still fresh, the cached Apify dataset is re-read instead of starting
+    a new actor run. `refresh=True` always runs the scraper.
+    """
+    key = cache_key(country_code, sort_by, period_type, max_items)
+    data_path, meta_path = _paths(key)
+    meta = _read_meta(meta_path)
+    fresh = meta is not None and time.time() - meta.get("fetched_at", 0) <= max_age
+
+    if fresh and not refresh:
+        age = int(time.time() - meta["fetched_at"])
+        if os.path.exists(data_path):
+            log.write(f"♻️ Using cached trending videos ({age}s old).")
+            record_cache("trending", hits=1)
+            return pd.read_parquet(data_path)
+        if meta.get("dataset_id"):
+            log.write(f"♻️ Re-reading cached Apify dataset {meta['dataset_id']} ({age}s old).")
+            raw_df = load_trending_dataset(meta["dataset_id"])
+            if not raw_df.empty:
+                record_cache("trending", hits=1)
+                video_df = process_raw_data(raw_df)
+                _write_entry(key, video_df, meta)
+                return video_df
+
+    record_cache("trending", misses=1)
+    raw_df = run_trending_scraper(
+        country_code=country_code,
+        sort_by=sort_by,
+        period_type=period_type,
+        max_items=max_items
+    )
+    if raw_df is None or raw_df.empty:
+        return pd.DataFrame()
+
+    video_df = process_raw_data(raw_df)
+    if not video_df.empty:
+        _write_entry(key, video_df, {
+            "country": country_code,
+            "sort": sort_by,
+            "period": period_type,
+            "max_items": int(max_items),
+            "dataset_id": raw_df.attrs.get("dataset_id"),
+            "fetched_at": time.time(),
+            "rows": len(video_df),
+        })
+    return video_df
+
+
+def combine_regions(frames: list) -> pd.DataFrame:
+    """
+    Unions processed trending frames and keeps one row per video_id. 'regions' lists every
+    region the video trended in (comma-separated, sorted) and 'region_count' how many.
+    """
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame()
+
+    combined = pd.concat(frames, ignore_index=True)
+    combined["video_id"] = combined["video_id"].astype("string")
+
+    pairs = combined[["video_id", "region"]].dropna().drop_duplicates().sort_values(["video_id", "region"])
+    grouped = pairs.groupby("video_id", sort=False)["region"]
+    regions = grouped.agg(",".join)
+    region_count = grouped.size()
+
+    unique = combined.drop_duplicates("video_id").reset_index(drop=True)
+    return unique.assign(
+        regions=unique["video_id"].map(regions),
+        region_count=unique["video_id"].map(region_count).fillna(0).astype(int),
+    )
+
+
+@timed_stage()
+def fetch_trending_fanout(countries, sort_modes=("hot",), periods=("last 7 days",), max_items=10,
+                          max_parallel: int = TRENDING_MAX_PARALLEL, max_age: int = TRENDING_CACHE_MAX_AGE,
+                          refresh: bool = False) -> pd.DataFrame:
+    """
+    Runs fetch_trending_videos for every (country, sort, period) combination, at most
+    `max_parallel` at a time, and returns the union deduplicated by video_id (see combine_regions).
+    Each combination goes through the trending cache as usual.
+    """
+    combos = list(itertools.product(countries, sort_modes, periods))
+    log.write(f"🌍 Fetching {len(combos)} trending scrapes ({max_parallel} at a time)...")
+
+    def fetch(combo):
+        country, sort_by, period = combo
+        try:
+            return fetch_trending_videos(country, sort_by, period, max_items, max_age=max_age, refresh=refresh)
+        except Exception as e:
+            log.warning(f"⚠️ Trending scrape failed for {country} / {sort_by} / {period}: {e}")
+            return pd.DataFrame()
+
+    with sink_executor(max_workers=max(1, max_parallel)) as executor:
+        frames = list(executor.map(fetch, combos))
+
+    failed = sum(1 for df in frames if df.empty)
+    if failed:
+        log.warning(f"⚠️ {failed} of {len(combos)} trending scrapes returned no data.")
+
+    video_df = combine_regions(frames)
+    log.write(f"🎥 {sum(len(df) for df in frames)} videos fetched, {len(video_df)} unique.")
+    return video_df